@@ -10,20 +10,26 @@ https://github.com/luchko/QCodeEditor
 @author: Ivan Luchko (luchko.ivan@gmail.com)
 '''
 
+from concurrent.futures import ThreadPoolExecutor
 import binaryninjaui
 from binaryninja import log_warn, bncompleter
 if "qt_major_version" in binaryninjaui.__dict__ and binaryninjaui.qt_major_version == 6:
-    from PySide6.QtCore import Qt, QRect
+    from PySide6.QtCore import Qt, QRect, QObject, QTimer, Signal
     from PySide6.QtWidgets import QWidget, QPlainTextEdit
     from PySide6.QtGui import (QPainter, QFont, QSyntaxHighlighter, QTextCharFormat, QTextCursor)
 else:
-    from PySide2.QtCore import Qt, QRect
+    from PySide2.QtCore import Qt, QRect, QObject, QTimer, Signal
     from PySide2.QtWidgets import QWidget, QPlainTextEdit
     from PySide2.QtGui import (QPainter, QFont, QSyntaxHighlighter, QTextCharFormat, QTextCursor)
 from binaryninjaui import (getMonospaceFont, getThemeColor, ThemeColor)
 try:
-    from pygments import highlight
+    from .snippet_trace import tracer
+except ImportError:
+    from snippet_trace import tracer
+try:
     from pygments.lexers import *
+    from pygments.lexer import RegexLexer
+    from pygments.token import Whitespace, Error, _TokenType
     from pygments.formatter import Formatter
 
     class QFormatter(Formatter):
@@ -39,11 +45,94 @@ try:
                 else:
                     self.pygstyles[str(token)]=bnstyles['Token.Name']
                     #log_warn("NONE: %s with %s" % (tokenname, str(token)))
+            # Share one QTextCharFormat between styles that look the same so the
+            # spans of adjacent tokens can be merged with a cheap identity check.
+            unique=[]
+            for tokenname, style in self.pygstyles.items():
+                match = next((seen for seen in unique if seen == style), None)
+                if match is None:
+                    unique.append(style)
+                else:
+                    self.pygstyles[tokenname] = match
+
+        def styleFor(self, token):
+            tokenname = str(token)
+            if tokenname not in self.pygstyles:
+                # Lexers can emit token types the style doesn't know about, fall
+                # back to the closest parent that it does.
+                parent = token.parent
+                while parent is not None and str(parent) not in self.pygstyles:
+                    parent = parent.parent
+                self.pygstyles[tokenname] = self.pygstyles[str(parent)] if parent is not None else bnstyles['Token.Name']
+            return self.pygstyles[tokenname]
 
         def format(self, tokensource, outfile):
-            self.data=[]
+            # Run-length encode the formats as (start, length, format) spans,
+            # merging adjacent tokens that end up with the same style.
+            self.spans=[]
+            start = 0
             for token, value in tokensource:
-                self.data.extend([self.pygstyles[str(token)],]*len(value))
+                if not value:
+                    continue
+                style = self.styleFor(token)
+                if self.spans and self.spans[-1][2] is style:
+                    last = self.spans[-1]
+                    self.spans[-1] = (last[0], last[1] + len(value), style)
+                else:
+                    self.spans.append((start, len(value), style))
+                start += len(value)
+
+    def lexLine(lexer, text, stack):
+        '''Lex one line of text starting from a saved lexer state stack.
+
+        This mirrors RegexLexer.get_tokens_unprocessed but also hands back the
+        state stack at the end of the line so the next line can resume from it
+        without re-lexing everything above it.'''
+        pos = 0
+        tokendefs = lexer._tokens
+        statestack = list(stack)
+        statetokens = tokendefs[statestack[-1]]
+        tokens = []
+        while 1:
+            for rexmatch, action, new_state in statetokens:
+                m = rexmatch(text, pos)
+                if m:
+                    if action is not None:
+                        if type(action) is _TokenType:
+                            tokens.append((pos, action, m.group()))
+                        else:
+                            tokens.extend(action(lexer, m))
+                    pos = m.end()
+                    if new_state is not None:
+                        if isinstance(new_state, tuple):
+                            for state in new_state:
+                                if state == '#pop':
+                                    if len(statestack) > 1:
+                                        statestack.pop()
+                                elif state == '#push':
+                                    statestack.append(statestack[-1])
+                                else:
+                                    statestack.append(state)
+                        elif isinstance(new_state, int):
+                            if abs(new_state) >= len(statestack):
+                                del statestack[1:]
+                            else:
+                                del statestack[new_state:]
+                        elif new_state == '#push':
+                            statestack.append(statestack[-1])
+                        statetokens = tokendefs[statestack[-1]]
+                    break
+            else:
+                if pos >= len(text):
+                    break
+                if text[pos] == '\n':
+                    statestack = ['root']
+                    statetokens = tokendefs['root']
+                    tokens.append((pos, Whitespace, '\n'))
+                else:
+                    tokens.append((pos, Error, text[pos]))
+                pos += 1
+        return tokens, tuple(statestack)
 
     class Pylighter(QSyntaxHighlighter):
 
@@ -51,23 +140,116 @@ try:
             QSyntaxHighlighter.__init__(self, parent)
             self.formatter=QFormatter()
             self.lexer=get_lexer_by_name(lang)
+            # Qt only stores an int per block, so map each distinct lexer state
+            # stack to a small id. Qt re-highlights the following block whenever
+            # the id stored for a block changes.
+            self.stateStacks = [('root',)]
+            self.stateIds = {('root',): 0}
+
+        def stateId(self, stack):
+            if stack not in self.stateIds:
+                self.stateIds[stack] = len(self.stateStacks)
+                self.stateStacks.append(stack)
+            return self.stateIds[stack]
+
+        def highlightBlock(self, text):
+            previous = self.previousBlockState()
+            stack = self.stateStacks[previous] if previous >= 0 else self.stateStacks[0]
+            line = text + '\n'
+            with tracer.span("highlightBlock", "highlighter"):
+                if isinstance(self.lexer, RegexLexer):
+                    tokens, stack = lexLine(self.lexer, line, stack)
+                else:
+                    tokens = list(self.lexer.get_tokens_unprocessed(line))
+                self.setCurrentBlockState(self.stateId(stack))
+                self.formatter.format(((token, value) for _, token, value in tokens), None)
+
+                for start, length, style in self.formatter.spans:
+                    if start >= len(text):
+                        break
+                    self.setFormat(start, min(length, len(text) - start), style)
+
+    class LexNotifier(QObject):
+        # Emitted from the worker thread, delivered on the GUI thread
+        finished = Signal(int, object)
+
+    class BackgroundPylighter(Pylighter):
+        '''Pylighter variant that lexes a snapshot of the document on a worker thread.
+
+        Edits are debounced; once the document has been quiet for `delay` ms the
+        whole text is lexed in the background and the resulting spans are only
+        applied if no edit happened in the meantime. Until then highlightBlock
+        reuses the last spans it had for a block, so typing never waits on pygments.'''
+
+        def __init__(self, parent, lang, delay=150):
+            Pylighter.__init__(self, parent, lang)
+            self.workerFormatter = QFormatter()
+            self.results = {}
+            self.revision = 0
+            self.executor = ThreadPoolExecutor(max_workers=1)
+            self.notifier = LexNotifier()
+            self.notifier.finished.connect(self.applyResults)
+            self.timer = QTimer()
+            self.timer.setSingleShot(True)
+            self.timer.setInterval(delay)
+            self.timer.timeout.connect(self.startLexing)
+            # QTextDocument.revision() also moves when formats are applied, so
+            # keep our own counter that only tracks edits to the text.
+            self.document().contentsChange.connect(self.contentsChanged)
+
+        def contentsChanged(self, position, removed, added):
+            self.revision += 1
+            self.timer.start()
+
+        def startLexing(self):
+            self.executor.submit(self.lexDocument, self.document().toPlainText(), self.revision)
+
+        def lexDocument(self, text, revision):
+            with tracer.span("lexDocument", "highlighter", revision=revision):
+                self.lexSnapshot(text, revision)
+
+        def lexSnapshot(self, text, revision):
+            results = []
+            stack = ('root',)
+            for number, line in enumerate(text.split('\n')):
+                if number % 256 == 0 and revision != self.revision:
+                    return
+                if isinstance(self.lexer, RegexLexer):
+                    tokens, stack = lexLine(self.lexer, line + '\n', stack)
+                else:
+                    tokens = list(self.lexer.get_tokens_unprocessed(line + '\n'))
+                self.workerFormatter.format(((token, value) for _, token, value in tokens), None)
+                results.append((line, self.workerFormatter.spans))
+            self.notifier.finished.emit(revision, results)
+
+        def applyResults(self, revision, results):
+            if revision != self.revision:
+                return
+            previous = self.results
+            self.results = dict(enumerate(results))
+            with tracer.span("applyResults", "highlighter", revision=revision):
+                block = self.document().firstBlock()
+                while block.isValid():
+                    number = block.blockNumber()
+                    if previous.get(number) != self.results.get(number):
+                        self.rehighlightBlock(block)
+                    block = block.next()
 
         def highlightBlock(self, text):
-            cb = self.currentBlock()
-            p = cb.position()
-            text=self.document().toPlainText()+' \n'
-            highlight(text,self.lexer,self.formatter)
-
-            #dirty, dirty hack
-            for i in range(len(text)):
-                try:
-                    self.setFormat(i,1,self.formatter.data[p+i])
-                except IndexError:
-                    pass
+            # A stale entry (the line was edited since the last pass) is still
+            # applied so the line keeps its colors until the worker catches up.
+            entry = self.results.get(self.currentBlock().blockNumber())
+            if entry is None:
+                return
+            for start, length, style in entry[1]:
+                if start >= len(text):
+                    break
+                self.setFormat(start, min(length, len(text) - start), style)
 
 except:
     log_warn("Pygments not installed, no syntax highlighting enabled.")
     Pylighter=None
+    BackgroundPylighter=None
 
 
 def bnformat(color, style=''):
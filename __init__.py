@@ -2,29 +2,40 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
+import re
 import shutil
 import codecs
 import getpass
+import io
+import time
+import cProfile
+import hashlib
+import pstats
 from collections import namedtuple
 from datetime import datetime
 from pathlib import Path
 
-from binaryninja import user_plugin_path, core_version, execute_on_main_thread_and_wait
-from binaryninja.plugin import BackgroundTaskThread
-from binaryninja.log import (log_error, log_debug, log_alert, log_warn)
+from binaryninja import user_plugin_path, core_version, execute_on_main_thread, execute_on_main_thread_and_wait
+from binaryninja.plugin import BackgroundTask
+from binaryninja.log import (log_error, log_debug, log_alert, log_warn, log_info)
 from binaryninja.settings import Settings
-from binaryninja.interaction import get_directory_name_input
-from binaryninja.variable import Variable
-from binaryninja.enums import FunctionGraphType
-from binaryninjaui import (getMonospaceFont, UIAction, UIActionHandler, Menu, UIContext)
+from binaryninja.interaction import get_directory_name_input, get_save_filename_input, show_plain_text_report, show_markdown_report
+from binaryninjaui import (getMonospaceFont, UIAction, UIActionHandler, Menu, UIContext, UIContextNotification)
 from PySide6.QtWidgets import (QLineEdit, QPushButton, QApplication, QWidget,
      QVBoxLayout, QHBoxLayout, QDialog, QFileSystemModel, QTreeView, QLabel, QSplitter,
-     QInputDialog, QMessageBox, QHeaderView, QKeySequenceEdit, QCheckBox, QMenu, QAbstractItemView)
+     QInputDialog, QMessageBox, QHeaderView, QKeySequenceEdit, QCheckBox, QMenu, QAbstractItemView,
+     QListWidget, QListWidgetItem, QTreeWidget, QTreeWidgetItem)
 from PySide6.QtCore import (QDir, Qt, QFileInfo, QItemSelectionModel, QSettings, QUrl,
-                            QFileSystemWatcher, QObject, Signal, Slot)
+                            QFileSystemWatcher, QObject, QTimer, QEvent, Signal, Slot)
 from PySide6.QtGui import (QFontMetrics, QDesktopServices, QKeySequence, QIcon, QColor, QAction,
                            QCursor, QGuiApplication)
-from .QCodeEditor import QCodeEditor, Pylighter
+from .QCodeEditor import QCodeEditor, Pylighter, BackgroundPylighter
+from .snippet_index import SnippetIndex, readSnippet, fileHash
+from .snippet_discovery import scanTree
+from .snippet_search import FuzzyIndex, TrigramIndex
+from .snippet_history import RunHistory
+from .snippet_trace import tracer
+from .snippet_runtime import CodeCache, ResultCache, SnippetScheduler, BatchSnippetTask, setupGlobals
 
 Settings().register_group("snippets", "Snippets")
 Settings().register_setting("snippets.syntaxHighlight", """
@@ -32,7 +43,56 @@ Settings().register_setting("snippets.syntaxHighlight", """
         "title" : "Syntax Highlighting",
         "type" : "boolean",
         "default" : true,
-        "description" : "Whether to syntax highlight (may be performance problems with very large snippets and the current highlighting implementation.)",
+        "description" : "Whether to syntax highlight snippets in the editor",
+        "ignore" : ["SettingsProjectScope", "SettingsResourceScope"]
+    }
+    """)
+Settings().register_setting("snippets.backgroundHighlight", """
+    {
+        "title" : "Background Syntax Highlighting",
+        "type" : "boolean",
+        "default" : false,
+        "description" : "Lex snippets on a worker thread and apply highlighting shortly after typing stops. Keeps the editor responsive with very large snippets.",
+        "ignore" : ["SettingsProjectScope", "SettingsResourceScope"]
+    }
+    """)
+Settings().register_setting("snippets.bytecodeCache", """
+    {
+        "title" : "Cache Compiled Snippets On Disk",
+        "type" : "boolean",
+        "default" : false,
+        "description" : "Also store compiled snippets in a snippets_pycache folder next to the snippet folder so they don't need to be compiled again in a new session.",
+        "ignore" : ["SettingsProjectScope", "SettingsResourceScope"]
+    }
+    """)
+Settings().register_setting("snippets.workerThreads", """
+    {
+        "title" : "Snippet Worker Threads",
+        "type" : "number",
+        "default" : 1,
+        "minValue" : 1,
+        "maxValue" : 64,
+        "description" : "How many snippets may run at the same time. Further runs wait in the task list until a worker is free. Takes effect after a restart.",
+        "ignore" : ["SettingsProjectScope", "SettingsResourceScope"]
+    }
+    """)
+Settings().register_setting("snippets.cacheSize", """
+    {
+        "title" : "Snippet Cache Size (MB)",
+        "type" : "number",
+        "default" : 128,
+        "minValue" : 0,
+        "maxValue" : 65536,
+        "description" : "Memory snippets may use for values kept between runs in snippet_cache. Least recently used values are dropped first, and a view's values are dropped whenever it is modified or its analysis changes. 0 turns the cache off. Takes effect after a restart.",
+        "ignore" : ["SettingsProjectScope", "SettingsResourceScope"]
+    }
+    """)
+Settings().register_setting("snippets.tracing", """
+    {
+        "title" : "Trace Snippet Runs",
+        "type" : "boolean",
+        "default" : false,
+        "description" : "Record timing spans for each phase of snippet runs, snippet reloads and highlighting. Export them with Snippets\\\\Export Trace... and open the file in Perfetto.",
         "ignore" : ["SettingsProjectScope", "SettingsResourceScope"]
     }
     """)
@@ -60,32 +120,69 @@ try:
 except IOError:
     log_error("Unable to create %s or unable to add example updater, please report this bug" % snippetPath)
 
+snippetIndex = SnippetIndex(os.path.realpath(os.path.join(user_plugin_path(), "..", "snippets_index.json")))
+snippetSearch = FuzzyIndex(snippetPath)
+snippetContents = TrigramIndex(os.path.realpath(os.path.join(user_plugin_path(), "..", "snippets_trigrams.json")))
+tracer.enabled = Settings().get_bool("snippets.tracing")
+snippetHistory = RunHistory(os.path.realpath(os.path.join(user_plugin_path(), "..", "snippets_history.jsonl")))
+snippetScheduler = SnippetScheduler(workers=Settings().get_integer("snippets.workerThreads"))
+resultCache = ResultCache(maxBytes=Settings().get_integer("snippets.cacheSize") * 1024 * 1024)
+if Settings().get_bool("snippets.bytecodeCache"):
+    codeCache = CodeCache(cacheDir=os.path.realpath(os.path.join(user_plugin_path(), "..", "snippets_pycache")))
+else:
+    codeCache = CodeCache()
+
+class ResultCacheReleaser(UIContextNotification):
+    # A closed view gets no more notifications, so let go of it and its cached values here
+    def OnBeforeCloseFile(self, context, file, frame):
+        resultCache.releaseFile(file.getMetadata())
+        return True
+
+resultCacheReleaser = ResultCacheReleaser()
+UIContext.registerNotification(resultCacheReleaser)
+
+
+def snippetSettings():
+    #Because you can't trust QT to do the right thing here
+    if (sys.platform == "darwin"):
+        return QSettings("Vector35", "Snippet Editor")
+    else:
+        return QSettings("Vector 35", "Snippet Editor")
+
+
+def priorityKey(snippet):
+    if not snippet:
+        raise ValueError("priorityKey needs a snippet path")
+    return "snippets/priority/" + os.path.relpath(snippet, snippetPath).replace(os.sep, "/")
+
+
+def snippetPriority(snippet):
+    return snippetSettings().value(priorityKey(snippet), 0, type=int)
+
+
+def profileKey(snippet):
+    if not snippet:
+        raise ValueError("profileKey needs a snippet path")
+    return "snippets/profile/" + os.path.relpath(snippet, snippetPath).replace(os.sep, "/")
+
+
+def snippetProfiled(snippet):
+    return snippetSettings().value(profileKey(snippet), False, type=bool)
+
 
 def includeWalk(dir, includeExt):
-    filePaths = []
-    for (root, dirs, files) in os.walk(dir):
-        for f in files:
-            if os.path.splitext(f)[1] in includeExt and '.git' not in root:
-                filePaths.append(os.path.join(root, f))
-    return filePaths
+    # Ignored folders (see snippet_discovery) are pruned before they are walked
+    return scanTree(dir, includeExt)[0]
 
 
 def loadSnippetFromFile(snippetPath):
-    try:
-        with codecs.open(snippetPath, 'r', 'utf-8') as snippetFile:
-            snippetText = snippetFile.readlines()
-    except:
+    (snippetDescription, snippetKeys, snippetCode, _) = readSnippet(snippetPath)
+    if not snippetCode:
         return ("", "", "")
-    if (len(snippetText) < 3):
-        return ("", "", "")
-    else:
-        qKeySequence = QKeySequence(snippetText[1].strip()[1:])
-        if qKeySequence.isEmpty():
-            qKeySequence = None
-        return (snippetText[0].strip()[1:].strip(),
-                qKeySequence,
-                ''.join(snippetText[2:])
-        )
+    qKeySequence = QKeySequence(snippetKeys)
+    if qKeySequence.isEmpty():
+        qKeySequence = None
+    return (snippetDescription, qKeySequence, snippetCode)
 
 
 def actionFromSnippet(snippetName, snippetDescription):
@@ -97,108 +194,10 @@ def actionFromSnippet(snippetName, snippetDescription):
     else:
         return "Snippets\\" + snippetDescription
 
-def setupGlobals(uiactioncontext, uicontext):
-    snippetGlobals = {}
-    snippetGlobals['current_view'] = uiactioncontext.binaryView
-    snippetGlobals['bv'] = uiactioncontext.binaryView
-    snippetGlobals['current_token'] = None
-    snippetGlobals['current_hlil'] = None
-    snippetGlobals['current_mlil'] = None
-    snippetGlobals['current_function'] = None
-    snippetGlobals['current_llil'] = None
-
-    action_handler = None
-    view_frame = None
-    view = None
-    if uicontext is not None:
-        action_handler = uicontext.getCurrentActionHandler()
-        view_frame = uicontext.getCurrentViewFrame()
-        view = uicontext.getCurrentView()
-
-    view_location = view_frame.getViewLocation() if view_frame is not None else None
-
-    if view is not None:
-        snippetGlobals['current_il_index'] = view.getSelectionStartILInstructionIndex()
-
-    view_location = view_frame.getViewLocation() if view_frame is not None else None
-
-    if uiactioncontext.function:
-        snippetGlobals['current_function'] = uiactioncontext.function
-        snippetGlobals['current_mlil'] = uiactioncontext.function.mlil_if_available
-        snippetGlobals['current_hlil'] = uiactioncontext.function.hlil_if_available
-        snippetGlobals['current_llil'] = uiactioncontext.function.llil_if_available
-        if uiactioncontext.token:
-            # Doubly nested because the first token is a HighlightTokenState
-            snippetGlobals['current_token'] = uiactioncontext.token
-        snippetGlobals['current_basic_block'] = uiactioncontext.function.get_basic_block_at(uiactioncontext.address)
-    else:
-        snippetGlobals['current_basic_block'] = None
-
-    snippetGlobals['current_address'] = uiactioncontext.address
-    if uiactioncontext.binaryView is not None and uiactioncontext.address is not None:
-        snippetGlobals['current_raw_offset'] = uiactioncontext.binaryView.get_data_offset_for_address(uiactioncontext.address)
-    else:
-        snippetGlobals['current_raw_offset'] = None
-
-    snippetGlobals['here'] = uiactioncontext.address
-    if uiactioncontext.address is not None and isinstance(uiactioncontext.length, int):
-        snippetGlobals['current_selection'] = (uiactioncontext.address, uiactioncontext.address+uiactioncontext.length)
-    else:
-        snippetGlobals['current_selection'] = None
-    snippetGlobals['current_ui_action_context'] = uiactioncontext
-    snippetGlobals['current_ui_context'] = uicontext
-
-    if view_location is not None and view_location.isValid():
-        active_il_index = view_location.getInstrIndex()
-        ilType = view_location.getILViewType()
-        active_il_function = None
-        if ilType == FunctionGraphType.LowLevelILFunctionGraph and uiactioncontext.function and uiactioncontext.function.llil_if_available:
-            active_il_function = uiactioncontext.function.llil_if_available
-        elif ilType == FunctionGraphType.LowLevelILSSAFormFunctionGraph and uiactioncontext.function and uiactioncontext.function.llil_if_available:
-            active_il_function = uiactioncontext.function.llil_if_available.ssa_form
-        elif ilType == FunctionGraphType.MediumLevelILFunctionGraph and uiactioncontext.function and uiactioncontext.function.mlil_if_available:
-            active_il_function = uiactioncontext.function.mlil_if_available
-        elif ilType == FunctionGraphType.MediumLevelILSSAFormFunctionGraph and uiactioncontext.function and uiactioncontext.function.mlil_if_available:
-            active_il_function = uiactioncontext.function.mlil_if_available.ssa_form
-        elif ilType == FunctionGraphType.HighLevelILFunctionGraph and uiactioncontext.function and uiactioncontext.function.hlil_if_available:
-            active_il_function = uiactioncontext.function.hlil_if_available
-        elif ilType == FunctionGraphType.HighLevelILSSAFormFunctionGraph and uiactioncontext.function and uiactioncontext.function.hlil_if_available:
-            active_il_function = uiactioncontext.function.hlil_if_available.ssa_form
-
-        if active_il_function:
-            il_start = view.getSelectionStartILInstructionIndex()
-
-            snippetGlobals['current_il_function'] = active_il_function
-            snippetGlobals['current_il_instruction'] = active_il_function[active_il_index]
-            snippetGlobals["current_il_basic_block"] = active_il_function[active_il_index].il_basic_block
-            snippetGlobals['current_il_instructions'] = (active_il_function[i] for i in range(
-                min(il_start, active_il_index),
-                max(il_start, active_il_index) + 1)
-            )
-        else:
-            snippetGlobals['current_il_function'] = None
-            snippetGlobals['current_il_instruction'] = None
-            snippetGlobals["current_il_basic_block"] = None
-            snippetGlobals['current_il_instructions'] = None
-
-        var = None
-        if uiactioncontext is not None:
-            token_state = uiactioncontext.token
-            token = token_state.token if token_state.valid else None
-            var = token_state.localVar if token_state.localVarValid else None
-            if var and uiactioncontext.function:
-                var = Variable.from_core_variable(uiactioncontext.function, var)
-
-        snippetGlobals['current_variable'] = var
-        snippetGlobals['current_variable'] = token
-
-    return snippetGlobals
-
-
-def executeSnippet(code, description):
+def currentActionContext():
     #Get UI context, try currently selected otherwise default to the first one if the snippet widget is selected.
     ctx = UIContext.activeContext()
-    dummycontext = {'binaryView': None, 'address': None, 'function': None, 'token': None, 'lowLevelILFunction': None, 'mediumLevelILFunction': None}
+    dummycontext = {'binaryView': None, 'address': None, 'length': None, 'function': None, 'token': None, 'lowLevelILFunction': None, 'mediumLevelILFunction': None}
     if not ctx:
         ctx = UIContext.allContexts()[0]
     if not ctx:
@@ -211,23 +210,152 @@ def executeSnippet(code, description):
             context = handler.actionContext()
         else:
             context = namedtuple("context", dummycontext.keys())(*dummycontext.values())
+    return (ctx, context)
+
 
-    snippetGlobals = setupGlobals(context, ctx)
+def executeSnippet(code, description, snippet=None, priority=0, profilePath=None):
+    (ctx, context) = currentActionContext()
 
-    SnippetTask(code, snippetGlobals, context, snippetName=description).start()
+    start = time.perf_counter()
+    with tracer.span("setupGlobals", snippet=description):
+        snippetGlobals = setupGlobals(context, ctx, resultCache, snippet or description)
+    log_debug("Snippets: Prepared globals for %s in %.3fms" % (description, (time.perf_counter() - start) * 1000))
+
+    task = SnippetTask(code, snippetGlobals, context, snippetName=description, profilePath=profilePath, snippet=snippet)
+    snippetScheduler.submit(task, key=snippet, priority=priority)
+
+
+builtinActions = ["Snippets\\Snippet Editor...", "Snippets\\Find Snippet...", "Snippets\\Search Snippet Contents...", "Snippets\\Rerun Last Snippet", "Snippets\\Profile Last Snippet", "Snippets\\Run Last Snippet Per Function", "Snippets\\Show Run Statistics", "Snippets\\Export Trace...", "Snippets\\Reload All Snippets"]
+
+class SnippetRegistry:
+    """Keeps the Snippets\\ actions in line with the snippet folder.
+
+    The registered set is diffed against the snippets on disk so only actions
+    whose path, description or hotkey changed are unregistered and re-added."""
+
+    def __init__(self):
+        self.actions = {}
+        self.swept = False
+
+    def sweep(self):
+        # Clear out actions left behind by a previous load of the plugin
+        for action in list(filter(lambda x: x.startswith("Snippets\\"), UIAction.getAllRegisteredActions())):
+            if action not in builtinActions:
+                self.removeAction(action)
+        self.swept = True
+
+    def addAction(self, actionText, snippet, hotkey):
+        snippetKeys = QKeySequence(hotkey)
+        if snippetKeys.isEmpty():
+            UIAction.registerAction(actionText)
+        else:
+            UIAction.registerAction(actionText, snippetKeys)
+        UIActionHandler.globalActions().bindAction(actionText, UIAction(makeSnippetFunction(snippet)))
+        Menu.mainMenu("Plugins").addAction(actionText, "Snippets")
+        self.actions[actionText] = (snippet, hotkey)
+
+    def removeAction(self, actionText):
+        UIActionHandler.globalActions().unbindAction(actionText)
+        Menu.mainMenu("Plugins").removeAction(actionText)
+        UIAction.unregisterAction(actionText)
+        self.actions.pop(actionText, None)
+
+    def update(self, snippets):
+        """Sync the registered actions with [(path, indexEntry), ...]."""
+        if not self.swept:
+            self.sweep()
+        wanted = {}
+        for (snippet, entry) in snippets:
+            if entry["code"]:
+                wanted[actionFromSnippet(snippet, entry["description"])] = (snippet, entry["hotkey"])
+        for actionText, registered in list(self.actions.items()):
+            if wanted.get(actionText) != registered:
+                self.removeAction(actionText)
+        for actionText, (snippet, hotkey) in wanted.items():
+            if actionText not in self.actions:
+                self.addAction(actionText, snippet, hotkey)
+
+snippetRegistry = SnippetRegistry()
+
+SnippetBaseline = namedtuple("SnippetBaseline", ["name", "description", "hotkey", "hash"])
+
+
+class SnippetWatcher(QObject):
+    """Watches every folder below root and reports bursts of changes as one batch.
+
+    Events are collected until nothing has changed for `delay` ms and then
+    emitted together through `changed`. Writes announced with ignoreWrite() are
+    dropped as long as the file still holds exactly what was written."""
+    changed = Signal(set)
+
+    def __init__(self, root, delay=250, parent=None):
+        super(SnippetWatcher, self).__init__(parent)
+        self.root = root
+        self.pending = set()
+        self.ownWrites = {}
+        self.files = set()
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.queue)
+        self.watcher.fileChanged.connect(self.queue)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.flush)
+        self.watchTree(root)
+
+    def watchTree(self, folder):
+        watched = set(self.watcher.directories())
+        folders = [path for path in scanTree(self.root, folder=folder)[1] if path not in watched]
+        if folders:
+            self.watcher.addPaths(folders)
+
+    def watchFile(self, path):
+        self.files.add(path)
+        if os.path.isfile(path) and path not in self.watcher.files():
+            self.watcher.addPath(path)
+
+    def unwatchFile(self, path):
+        self.files.discard(path)
+        if path in self.watcher.files():
+            self.watcher.removePath(path)
+
+    def ignoreWrite(self, path, data):
+        self.ownWrites[path] = hashlib.sha256(data).hexdigest()
+
+    def queue(self, path):
+        self.pending.add(path)
+        self.timer.start()
+
+    def flush(self):
+        changed = set()
+        for path in self.pending:
+            if os.path.isdir(path):
+                # Pick up folders created (or moved in) since the last scan
+                self.watchTree(path)
+            elif path in self.ownWrites and self.ownWrites.pop(path) == fileHash(path):
+                continue
+            changed.add(path)
+        self.pending = set()
+        # Editors that save by replacing the file drop it from the watch list
+        for path in self.files:
+            if os.path.isfile(path) and path not in self.watcher.files():
+                self.watcher.addPath(path)
+        if changed:
+            self.changed.emit(changed)
 
 
 lastSnippet = None
-def makeSnippetFunction(snippet):
+def makeSnippetFunction(snippet, profile=False):
     def execute():
         global lastSnippet
         lastSnippet = snippet
 
-        (snippetDescription, snippetKeys, snippetCode) = loadSnippetFromFile(snippet)
-        snippetCode = "# \n# \n" + snippetCode
-        snippetCode = compile(snippetCode, snippet, 'exec')
+        (snippetDescription, snippetCode) = codeCache.get(snippet)
         actionText = actionFromSnippet(snippet, snippetDescription)
-        executeSnippet(snippetCode, actionText)
+        profilePath = None
+        if profile or snippetProfiled(snippet):
+            profilePath = os.path.splitext(snippet)[0] + ".pstats"
+        executeSnippet(snippetCode, actionText, snippet, snippetPriority(snippet), profilePath)
     return lambda context: execute()
 
 
@@ -237,24 +365,96 @@ def rerunLastSnippet(context):
         makeSnippetFunction(lastSnippet)(context)
 
 
+def profileLastSnippet(context):
+    global lastSnippet
+    if lastSnippet is not None:
+        makeSnippetFunction(lastSnippet, profile=True)(context)
+
+
+def runSnippetPerFunction(snippet, bv, functions=None, workers=None):
+    """Queue a snippet to run once per function of bv, or only for `functions` if given.
+
+    Each run sees current_function, current_address and the current_*il globals
+    for its function. Returns the BatchSnippetTask; its results and errors dicts
+    (keyed by function start) fill in as it runs and wait() blocks until done."""
+    (snippetDescription, snippetCode) = codeCache.get(snippet)
+    actionText = actionFromSnippet(snippet, snippetDescription)
+    task = BatchSnippetTask(snippetCode, bv, functions, f"{actionText} (per function)", workers, updateAnalysis=gUpdateAnalysisOnRun,
+                            resultCache=resultCache, snippet=snippet)
+    snippetScheduler.submit(task, key=(snippet, "per function"), priority=snippetPriority(snippet))
+    return task
+
+
+def runLastSnippetPerFunction(context):
+    global lastSnippet
+    if lastSnippet is None:
+        return
+    if context.binaryView is None:
+        log_warn("Snippets: Open a binary to run a snippet per function.")
+        return
+    runSnippetPerFunction(lastSnippet, context.binaryView)
+
+
 # Global variable to indicate if analysis should be updated after a snippet is run
 gUpdateAnalysisOnRun = False
 
-class SnippetTask(BackgroundTaskThread):
-    def __init__(self, code, snippetGlobals, context, snippetName="Executing snippet"):
-        BackgroundTaskThread.__init__(self, f"{snippetName}...", False)
+# Number of functions listed in the report after profiling a snippet
+gProfileTopFunctions = 30
+
+class SnippetTask(BackgroundTask):
+    def __init__(self, code, snippetGlobals, context, snippetName="Executing snippet", profilePath=None, snippet=None):
+        BackgroundTask.__init__(self, f"{snippetName}...", True)
+        self.name = snippetName
         self.code = code
         self.globals = snippetGlobals
         self.context = context
+        self.profilePath = profilePath
+        self.snippet = snippet
 
     def run(self):
+        # Record every run, successful or not, in the run history
+        wallStart = time.perf_counter()
+        cpuStart = time.thread_time()
+        exception = None
+        try:
+            with tracer.span("run", snippet=self.name):
+                self.runSnippet()
+        except BaseException as e:
+            exception = type(e).__name__
+            raise
+        finally:
+            view = None
+            if self.context.binaryView is not None:
+                view = self.context.binaryView.file.filename
+            snippetHistory.record(self.snippet or self.name, codeCache.contentHash(self.snippet), view,
+                                  time.perf_counter() - wallStart, time.thread_time() - cpuStart,
+                                  exception, gUpdateAnalysisOnRun)
+
+    def runSnippet(self):
         if self.context.binaryView:
             self.context.binaryView.begin_undo_actions()
-        snippetGlobals = self.globals
-        exec("from binaryninja import *", snippetGlobals)
-        exec(self.code, snippetGlobals)
-        if gUpdateAnalysisOnRun:
-            exec("bv.update_analysis_and_wait()", snippetGlobals)
+        try:
+            with tracer.span("resolve globals", snippet=self.name):
+                snippetGlobals = self.globals.resolve(self.code)
+            with tracer.span("snippet", snippet=self.name):
+                if self.profilePath:
+                    self.profile(snippetGlobals)
+                else:
+                    exec(self.code, snippetGlobals)
+            if gUpdateAnalysisOnRun:
+                with tracer.span("update_analysis_and_wait"):
+                    exec("bv.update_analysis_and_wait()", snippetGlobals)
+            with tracer.span("navigate"):
+                self.navigate(snippetGlobals)
+        finally:
+            # Failed and cancelled runs close their undo group too, so what they changed undoes in one step
+            if self.context.binaryView:
+                with tracer.span("commit_undo_actions"):
+                    self.context.binaryView.commit_undo_actions()
+
+    def navigate(self, snippetGlobals):
+        if self.context.binaryView is None:
+            return
         if "here" in snippetGlobals and hasattr(self.context, "address") and snippetGlobals['here'] != self.context.address:
             self.context.binaryView.file.navigate(self.context.binaryView.file.view, snippetGlobals['here'])
         if "current_address" in snippetGlobals and hasattr(self.context, "address") and snippetGlobals['current_address'] != self.context.address:
@@ -263,9 +463,25 @@ class SnippetTask(BackgroundTaskThread):
             addr = self.context.binaryView.get_address_for_data_offset(snippetGlobals["current_raw_offset"])
             if addr is not None:
                 if not self.context.binaryView.file.navigate(self.context.binaryView.file.view, addr):
-                    binaryninja.mainthread.execute_on_main_thread(lambda: self.locals["current_ui_context"].navigateForBinaryView(self.active_view, addr))
-        if self.context.binaryView:
-            self.context.binaryView.commit_undo_actions()
+                    uicontext = snippetGlobals.get("current_ui_context")
+                    if uicontext is not None:
+                        execute_on_main_thread(lambda: uicontext.navigateForBinaryView(self.context.binaryView, addr))
+
+    def profile(self, snippetGlobals):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            exec(self.code, snippetGlobals)
+        finally:
+            profiler.disable()
+            try:
+                profiler.dump_stats(self.profilePath)
+            except OSError:
+                log_warn("Snippets: Unable to save profile to %s" % self.profilePath)
+            report = io.StringIO()
+            report.write("Saved to %s\n\n" % self.profilePath)
+            pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(gProfileTopFunctions)
+            show_plain_text_report(f"Profile: {self.name}", report.getvalue())
 
 
 class Snippets(QDialog):
@@ -291,12 +507,12 @@ class Snippets(QDialog):
         self.browseButton.setIcon(QIcon.fromTheme("edit-undo"))
         self.deleteSnippetButton = QPushButton("Delete")
         self.newSnippetButton = QPushButton("New Snippet")
-        self.watcher = QFileSystemWatcher()
-        self.watcher.addPath(snippetPath)
-        self.watcher.directoryChanged.connect(self.snippetDirectoryChanged)
-        self.watcher.fileChanged.connect(self.snippetDirectoryChanged)
+        self.watcher = SnippetWatcher(snippetPath, parent=self)
+        self.watcher.changed.connect(self.snippetsChanged)
         indentation = Settings().get_string("snippets.indentation")
-        if Settings().get_bool("snippets.syntaxHighlight"):
+        if Settings().get_bool("snippets.syntaxHighlight") and Settings().get_bool("snippets.backgroundHighlight"):
+            self.edit = QCodeEditor(SyntaxHighlighter=BackgroundPylighter, delimeter = indentation)
+        elif Settings().get_bool("snippets.syntaxHighlight"):
             self.edit = QCodeEditor(SyntaxHighlighter=Pylighter, delimeter = indentation)
         else:
             self.edit = QCodeEditor(SyntaxHighlighter=None, delimeter = indentation)
@@ -309,6 +525,7 @@ class Snippets(QDialog):
         self.currentHotkey = QKeySequence()
         self.currentHotkeyLabel = QLabel("")
         self.currentFile = ""
+        self.baseline = None
         self.snippetName = QLineEdit()
         self.snippetName.setPlaceholderText("snippet filename")
         self.snippetDescription = QLineEdit()
@@ -394,11 +611,7 @@ class Snippets(QDialog):
         hlayout.addWidget(hsplitter)
 
         self.showNormal() #Fixes bug that maximized windows are "stuck"
-        #Because you can't trust QT to do the right thing here
-        if (sys.platform == "darwin"):
-            self.settings = QSettings("Vector35", "Snippet Editor")
-        else:
-            self.settings = QSettings("Vector 35", "Snippet Editor")
+        self.settings = snippetSettings()
         if self.settings.contains("ui/snippeteditor/geometry"):
             self.restoreGeometry(self.settings.value("ui/snippeteditor/geometry"))
         else:
@@ -440,24 +653,16 @@ class Snippets(QDialog):
 
     @staticmethod
     def registerAllSnippets():
-        for action in list(filter(lambda x: x.startswith("Snippets\\"), UIAction.getAllRegisteredActions())):
-            if action in ["Snippets\\Snippet Editor...", "Snippets\\Reload All Snippets"]:
-                continue
-            UIActionHandler.globalActions().unbindAction(action)
-            Menu.mainMenu("Plugins").removeAction(action)
-            UIAction.unregisterAction(action)
-
-        for snippet in includeWalk(snippetPath, ".py"):
-            snippetKeys = None
-            (snippetDescription, snippetKeys, snippetCode) = loadSnippetFromFile(snippet)
-            actionText = actionFromSnippet(snippet, snippetDescription)
-            if snippetCode:
-                if snippetKeys == None:
-                    UIAction.registerAction(actionText)
-                else:
-                    UIAction.registerAction(actionText, snippetKeys)
-                UIActionHandler.globalActions().bindAction(actionText, UIAction(makeSnippetFunction(snippet)))
-                Menu.mainMenu("Plugins").addAction(actionText, "Snippets")
+        with tracer.span("registerAllSnippets"):
+            with tracer.span("includeWalk"):
+                snippetFiles = includeWalk(snippetPath, ".py")
+            with tracer.span("index refresh", snippets=len(snippetFiles)):
+                snippets = snippetIndex.refresh(snippetFiles)
+            with tracer.span("update actions"):
+                snippetRegistry.update(snippets)
+            with tracer.span("update search"):
+                snippetSearch.update(snippets)
+                snippetContents.update(snippets)
 
     def clearSelection(self):
         self.keySequenceEdit.clear()
@@ -466,8 +671,9 @@ class Snippets(QDialog):
         self.snippetName.setText("")
         self.snippetDescription.setText("")
         self.edit.clear()
-        self.watcher.removePath(self.currentFile)
+        self.watcher.unwatchFile(self.currentFile)
         self.currentFile = ""
+        self.baseline = None
 
     def askSave(self):
         return QMessageBox.question(self, self.tr("Save?"), self.tr("Do you want to save changes to:\n\n{}?").format(self.snippetName.text()), QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel)
@@ -505,6 +711,29 @@ class Snippets(QDialog):
         clip = QGuiApplication.clipboard()
         clip.setText(selection)
 
+    def setProfiled(self, checked):
+        selection = self.selectedSnippet()
+        if selection is not None:
+            self.settings.setValue(profileKey(selection), checked)
+
+    def selectedSnippet(self):
+        # The snippet under the tree's current index, None for a folder or when nothing is selected
+        index = self.tree.selectionModel().currentIndex()
+        if not index.isValid():
+            return None
+        selection = self.files.filePath(index)
+        if not selection or QFileInfo(selection).isDir():
+            return None
+        return selection
+
+    def setPriority(self):
+        selection = self.selectedSnippet()
+        if selection is None:
+            return
+        (priority, ok) = QInputDialog.getInt(self, self.tr("Snippet Priority"), self.tr("Priority (higher runs first when snippets are queued):"), snippetPriority(selection), -100, 100)
+        if ok:
+            self.settings.setValue(priorityKey(selection), priority)
+
     def selectFile(self, new, old):
         if (self.resetting):
             self.resetting = False
@@ -534,21 +763,31 @@ class Snippets(QDialog):
                     return False
 
         if self.currentFile:
-            self.watcher.removePath(self.currentFile)
+            self.watcher.unwatchFile(self.currentFile)
         self.currentFile = newSelection
-        self.watcher.addPath(self.currentFile)
+        self.watcher.watchFile(self.currentFile)
         self.loadSnippet()
 
     def loadSnippet(self):
-        (snippetDescription, snippetKeys, snippetCode) = loadSnippetFromFile(self.currentFile)
+        (snippetDescription, snippetKeys, snippetCode, contentHash) = readSnippet(self.currentFile)
+        if not snippetCode:
+            (snippetDescription, snippetKeys, snippetCode) = ("", "", "")
+        snippetKeys = QKeySequence(snippetKeys)
         self.snippetName.setText(os.path.basename(self.currentFile))
         self.snippetDescription.setText(snippetDescription) if snippetDescription else self.snippetDescription.setText("")
-        self.keySequenceEdit.setKeySequence(snippetKeys) if snippetKeys else self.keySequenceEdit.setKeySequence(QKeySequence(""))
+        self.keySequenceEdit.setKeySequence(snippetKeys)
         delimeter = "   " if snippetCode.count("    ") > snippetCode.count("\t") else "\t"
         self.edit.setPlainText(snippetCode) if snippetCode else self.edit.setPlainText("")
         self.edit.setDelimeter(delimeter)
+        self.setBaseline(contentHash)
         self.readOnly(False)
 
+    def setBaseline(self, contentHash):
+        """Remember what is on disk so snippetChanged() can compare without reading it again."""
+        self.baseline = SnippetBaseline(os.path.basename(self.currentFile), self.snippetDescription.text(),
+                                        self.keySequenceEdit.keySequence().toString(), contentHash)
+        self.edit.document().setModified(False)
+
     def newFileDialog(self):
         (snippetName, ok) = QInputDialog.getText(self, self.tr("Snippet Name"), self.tr("Snippet Name: "), flags=self.windowFlags())
         if ok and snippetName:
@@ -621,39 +860,46 @@ class Snippets(QDialog):
             self.tree.setCurrentIndex(self.files.index(path))
             self.registerAllSnippets()
 
-    def snippetDirectoryChanged(self):
-        # reload UI and reload snippets
+    def snippetsChanged(self, paths):
+        # The index only re-reads files that changed, so one pass covers the whole burst
         self.registerAllSnippets()
-        self.loadSnippet()
+        if self.baseline is not None and fileHash(self.currentFile) != self.baseline.hash:
+            self.loadSnippet()
 
     def snippetChanged(self):
-        if (self.currentFile == "" or QFileInfo(self.currentFile).isDir()):
+        # Compared against the baseline from the last load or save, no disk access
+        if self.baseline is None:
             return False
-        (snippetDescription, snippetKeys, snippetCode) = loadSnippetFromFile(self.currentFile)
-        if os.path.basename(self.currentFile) != self.snippetName.text():
-            return True
-        if snippetKeys == None and not self.keySequenceEdit.keySequence().isEmpty():
-            return True
-        if snippetKeys != None and snippetKeys != self.keySequenceEdit.keySequence().toString():
-            return True
-        return self.edit.toPlainText() != snippetCode or \
-               self.snippetDescription.text() != snippetDescription
+        return self.edit.document().isModified() or \
+               self.baseline.name != self.snippetName.text() or \
+               self.baseline.description != self.snippetDescription.text() or \
+               self.baseline.hotkey != self.keySequenceEdit.keySequence().toString()
 
     def save(self):
-        if os.path.basename(self.currentFile) != self.snippetName:
+        if os.path.basename(self.currentFile) != self.snippetName.text():
             #Renamed
             if not self.snippetName.text().endswith(".py") and not QMessageBox.question(self, self.tr("Rename?"), self.tr("Are you sure you want to rename?\n\n{} does not end in .py and you will not be able to rename back with snippets.").format(self.snippetName.text()), QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel) == QMessageBox.Yes:
                 return
             os.unlink(self.currentFile)
+            self.watcher.unwatchFile(self.currentFile)
             self.currentFile = os.path.join(os.path.dirname(self.currentFile), self.snippetName.text())
         log_debug("Snippets: Saving snippet %s" % self.currentFile)
+        snippetText = "#" + self.snippetDescription.text() + "\n"
+        snippetText += "#" + self.keySequenceEdit.keySequence().toString() + "\n"
+        snippetText += self.edit.toPlainText()
+        snippetData = snippetText.encode("utf-8")
+        # Our own write shouldn't come back through the watcher as a reload
+        self.watcher.ignoreWrite(self.currentFile, snippetData)
         outputSnippet = codecs.open(self.currentFile, "w", "utf-8")
-        outputSnippet.write("#" + self.snippetDescription.text() + "\n")
-        outputSnippet.write("#" + self.keySequenceEdit.keySequence().toString() + "\n")
-        outputSnippet.write(self.edit.toPlainText())
+        outputSnippet.write(snippetText)
         outputSnippet.close()
-        # Redundant because of file watcher
-        #self.registerAllSnippets()
+        # A quick second save can keep the old mtime and size, so don't trust them for this file
+        codeCache.invalidate(self.currentFile)
+        snippetIndex.remove(self.currentFile)
+        snippetContents.remove(self.currentFile)
+        self.watcher.watchFile(self.currentFile)
+        self.setBaseline(hashlib.sha256(snippetData).hexdigest())
+        self.registerAllSnippets()
 
     def editor(self):
         # Open in external editor
@@ -672,6 +918,20 @@ class Snippets(QDialog):
         self.save()
         self.registerAllSnippets()
 
+    def runPerFunction(self):
+        selection = self.selectedSnippet()
+        if selection is None:
+            return
+        if selection == self.currentFile and self.snippetChanged():
+            self.save()
+        (ctx, context) = currentActionContext()
+        if context.binaryView is None:
+            log_warn("Snippets: Open a binary to run a snippet per function.")
+            return
+        global lastSnippet
+        lastSnippet = selection
+        runSnippetPerFunction(selection, context.binaryView)
+
     def export(self):
         if self.snippetChanged():
             save = self.askSave()
@@ -836,14 +1096,195 @@ This plugin is released under an [MIT license](./LICENSE).
         newFolder.triggered.connect(self.newFolder)
         copyPath = menu.addAction("Copy Path")
         copyPath.triggered.connect(self.copyPath)
+        profile = menu.addAction("Profile Runs")
+        profile.setCheckable(True)
+        selection = self.selectedSnippet()
+        if selection is not None:
+            profile.setChecked(snippetProfiled(selection))
+        else:
+            profile.setEnabled(False)
+        profile.toggled.connect(self.setProfiled)
+        perFunction = menu.addAction("Run Per Function")
+        perFunction.triggered.connect(self.runPerFunction)
+        priority = menu.addAction("Set Priority...")
+        priority.triggered.connect(self.setPriority)
         menu.exec_(QCursor.pos())
 
 
+class SnippetFinder(QDialog):
+    """Type to fuzzy search snippet names, descriptions and folders, Enter runs the selection."""
+
+    def __init__(self, context, parent=None):
+        super(SnippetFinder, self).__init__(parent)
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
+        self.setWindowTitle(self.tr("Find Snippet"))
+        self.context = context
+        self.query = QLineEdit()
+        self.query.setPlaceholderText("snippet name, description or folder")
+        self.query.installEventFilter(self)
+        self.results = QListWidget()
+        layout = QVBoxLayout()
+        layout.addWidget(self.query)
+        layout.addWidget(self.results)
+        self.setLayout(layout)
+        self.setMinimumWidth(60 * QFontMetrics(self.font()).averageCharWidth())
+
+        # Coalesce fast typing into one search
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(30)
+        self.timer.timeout.connect(self.search)
+        self.query.textChanged.connect(self.timer.start)
+        self.query.returnPressed.connect(self.runSelected)
+        self.results.itemActivated.connect(self.runSelected)
+        # Index anything registered since the last search now rather than on the first keystroke
+        snippetSearch.flush()
+
+    def eventFilter(self, watched, event):
+        # Let the arrow keys move through the results while typing
+        if watched is self.query and event.type() == QEvent.KeyPress and event.key() in (Qt.Key_Up, Qt.Key_Down, Qt.Key_PageUp, Qt.Key_PageDown):
+            QApplication.sendEvent(self.results, event)
+            return True
+        return super(SnippetFinder, self).eventFilter(watched, event)
+
+    def search(self):
+        text = self.query.text()
+        with tracer.span("fuzzy search", query=text):
+            matches = snippetSearch.search(text)
+        self.results.clear()
+        for (score, snippet, description) in matches:
+            name = os.path.relpath(snippet, snippetPath)
+            item = QListWidgetItem("%s    (%s)" % (description, name) if description else name)
+            item.setData(Qt.UserRole, snippet)
+            self.results.addItem(item)
+        if matches:
+            self.results.setCurrentRow(0)
+
+    def runSelected(self, item=None):
+        if self.timer.isActive():
+            self.timer.stop()
+            self.search()
+        item = item or self.results.currentItem()
+        if item is None:
+            return
+        self.accept()
+        makeSnippetFunction(item.data(Qt.UserRole))(self.context)
+
+
+class SnippetContentSearch(QDialog):
+    """Substring or regex search through snippet bodies, activating a result opens it in the editor."""
+
+    def __init__(self, context, parent=None):
+        super(SnippetContentSearch, self).__init__(parent)
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
+        self.setWindowTitle(self.tr("Search Snippet Contents"))
+        self.context = context
+        self.query = QLineEdit()
+        self.query.setPlaceholderText("text or regular expression")
+        self.regex = QCheckBox(self.tr("Regular expression"))
+        self.matchCase = QCheckBox(self.tr("Match case"))
+        self.status = QLabel("")
+        self.results = QTreeWidget()
+        self.results.setHeaderHidden(True)
+        self.results.setFont(getMonospaceFont(self))
+        options = QHBoxLayout()
+        options.addWidget(self.regex)
+        options.addWidget(self.matchCase)
+        options.addStretch()
+        options.addWidget(self.status)
+        layout = QVBoxLayout()
+        layout.addWidget(self.query)
+        layout.addLayout(options)
+        layout.addWidget(self.results)
+        self.setLayout(layout)
+        self.setMinimumWidth(100 * QFontMetrics(self.results.font()).averageCharWidth())
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(200)
+        self.timer.timeout.connect(self.search)
+        self.query.textChanged.connect(self.timer.start)
+        self.query.returnPressed.connect(self.search)
+        self.regex.stateChanged.connect(self.search)
+        self.matchCase.stateChanged.connect(self.search)
+        self.results.itemActivated.connect(self.openResult)
+
+    def search(self):
+        self.timer.stop()
+        self.results.clear()
+        text = self.query.text()
+        if not text:
+            self.status.setText("")
+            return
+        try:
+            with tracer.span("content search", query=text):
+                matches = snippetContents.search(text, regex=self.regex.isChecked(), matchCase=self.matchCase.isChecked())
+        except re.error as e:
+            self.status.setText(self.tr("Invalid expression: %s") % e)
+            return
+        for (snippet, lines) in matches:
+            fileItem = QTreeWidgetItem([os.path.relpath(snippet, snippetPath)])
+            fileItem.setData(0, Qt.UserRole, (snippet, 0))
+            for (number, line) in lines:
+                lineItem = QTreeWidgetItem(["%5d: %s" % (number, line.strip())])
+                lineItem.setData(0, Qt.UserRole, (snippet, number))
+                fileItem.addChild(lineItem)
+            self.results.addTopLevelItem(fileItem)
+            fileItem.setExpanded(True)
+        self.status.setText(self.tr("%d snippets") % len(matches))
+
+    def openResult(self, item, column=0):
+        (snippet, line) = item.data(0, Qt.UserRole)
+        snippetSettings().setValue("ui/snippeteditor/selected", snippet)
+        launchPlugin(self.context)
+        # An editor that is already open only reads the saved selection when it's created
+        snippets.tree.setCurrentIndex(snippets.files.index(snippet))
+        # The first two lines of the file are the description and hotkey
+        if snippets.currentFile == snippet and line > 2:
+            block = snippets.edit.document().findBlockByNumber(line - 3)
+            cursor = snippets.edit.textCursor()
+            cursor.setPosition(block.position())
+            snippets.edit.setTextCursor(cursor)
+            snippets.edit.centerCursor()
+
+    def done(self, result):
+        # Keep what was indexed for the next session
+        snippetContents.save()
+        super(SnippetContentSearch, self).done(result)
+
+
 snippets = None
+finder = None
+contentSearch = None
 
 def reloadActions(_):
     Snippets.registerAllSnippets()
 
+def showRunStatistics(context):
+    stats = snippetHistory.stats()
+    if not stats:
+        log_warn("Snippets: No snippet runs have been recorded yet.")
+        return
+    report = "| Snippet | Runs | Failures | p50 (ms) | p95 (ms) | Mean CPU (ms) |\n"
+    report += "|---|---:|---:|---:|---:|---:|\n"
+    for snippet, stat in sorted(stats.items(), key=lambda item: item[1]["p95"] or 0, reverse=True):
+        name = os.path.relpath(snippet, snippetPath) if os.path.isabs(snippet) else snippet
+        report += "| %s | %d | %d (%.0f%%) | %.1f | %.1f | %.1f |\n" % (name, stat["count"], stat["failures"],
+            stat["failureRate"] * 100, (stat["p50"] or 0) * 1000, (stat["p95"] or 0) * 1000, stat["cpu"] * 1000)
+    show_markdown_report("Snippet Run Statistics", report)
+
+def exportTrace(context):
+    if not tracer.enabled:
+        log_warn("Snippets: Tracing is off, enable the snippets.tracing setting and restart to record spans.")
+        return
+    path = get_save_filename_input("Save trace as", "json", "snippets_trace.json")
+    if not path:
+        return
+    if isinstance(path, bytes):
+        path = path.decode("utf-8")
+    tracer.export(path)
+    log_info("Snippets: Saved %d trace events to %s" % (len(tracer.events), path))
+
 def launchPlugin(context):
     global snippets
     # Terrible hack to fix Shiboken freeing the object when snippets
@@ -858,13 +1299,53 @@ def launchPlugin(context):
         snippets = Snippets(context, parent=context.widget)
     snippets.show()
 
+def launchFinder(context):
+    global finder
+    if finder:
+        try:
+            finder.close()
+        except:
+            pass
+    finder = SnippetFinder(context, parent=context.widget)
+    finder.show()
+    finder.query.setFocus()
+
+def launchContentSearch(context):
+    global contentSearch
+    if contentSearch:
+        try:
+            contentSearch.close()
+        except:
+            pass
+    contentSearch = SnippetContentSearch(context, parent=context.widget)
+    contentSearch.show()
+    contentSearch.query.setFocus()
+
 Snippets.registerAllSnippets()
 UIAction.registerAction("Snippets\\Snippet Editor...")
+UIAction.registerAction("Snippets\\Find Snippet...")
+UIAction.registerAction("Snippets\\Search Snippet Contents...")
 UIAction.registerAction("Snippets\\Rerun Last Snippet")
+UIAction.registerAction("Snippets\\Profile Last Snippet")
+UIAction.registerAction("Snippets\\Run Last Snippet Per Function")
+UIAction.registerAction("Snippets\\Show Run Statistics")
+UIAction.registerAction("Snippets\\Export Trace...")
 UIAction.registerAction("Snippets\\Reload All Snippets")
 UIActionHandler.globalActions().bindAction("Snippets\\Snippet Editor...", UIAction(launchPlugin))
+UIActionHandler.globalActions().bindAction("Snippets\\Find Snippet...", UIAction(launchFinder))
+UIActionHandler.globalActions().bindAction("Snippets\\Search Snippet Contents...", UIAction(launchContentSearch))
 UIActionHandler.globalActions().bindAction("Snippets\\Rerun Last Snippet", UIAction(rerunLastSnippet))
+UIActionHandler.globalActions().bindAction("Snippets\\Profile Last Snippet", UIAction(profileLastSnippet))
+UIActionHandler.globalActions().bindAction("Snippets\\Run Last Snippet Per Function", UIAction(runLastSnippetPerFunction))
+UIActionHandler.globalActions().bindAction("Snippets\\Show Run Statistics", UIAction(showRunStatistics))
+UIActionHandler.globalActions().bindAction("Snippets\\Export Trace...", UIAction(exportTrace))
 UIActionHandler.globalActions().bindAction("Snippets\\Reload All Snippets", UIAction(reloadActions))
 Menu.mainMenu("Plugins").addAction("Snippets\\Snippet Editor...", "Snippet")
+Menu.mainMenu("Plugins").addAction("Snippets\\Find Snippet...", "Snippet")
+Menu.mainMenu("Plugins").addAction("Snippets\\Search Snippet Contents...", "Snippet")
 Menu.mainMenu("Plugins").addAction("Snippets\\Rerun Last Snippet", "Snippet")
+Menu.mainMenu("Plugins").addAction("Snippets\\Profile Last Snippet", "Snippet")
+Menu.mainMenu("Plugins").addAction("Snippets\\Run Last Snippet Per Function", "Snippet")
+Menu.mainMenu("Plugins").addAction("Snippets\\Show Run Statistics", "Snippet")
+Menu.mainMenu("Plugins").addAction("Snippets\\Export Trace...", "Snippet")
 Menu.mainMenu("Plugins").addAction("Snippets\\Reload All Snippets", "Snippet")
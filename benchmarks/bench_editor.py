@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Benchmarks for the snippet editor widget.
+
+Runs QCodeEditor against the stubbed Binary Ninja modules (see stubs.py) under
+the offscreen Qt platform, so no display is needed:
+
+    python3 benchmarks/bench_editor.py
+    python3 benchmarks/bench_editor.py --lines 100,5000 --json editor.json
+
+For every document size and highlighter this measures the time to open the
+document, per-keystroke latency while typing in the middle of it, the cost of
+repainting the line number bar while scrolling and Tab/Backtab over a large
+selection. Results are printed and optionally written as JSON; times are in
+milliseconds.
+'''
+
+import os
+import sys
+import json
+import time
+import statistics
+from argparse import ArgumentParser
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import stubs
+
+sample = '''#Synthetic benchmark snippet
+#
+import os
+from binaryninja import *
+
+class Visitor(object):
+    """Walk every function and collect the ones
+    calling into an import."""
+
+    def __init__(self, bv):
+        self.bv = bv
+        self.found = {}
+
+    def visit(self, function):
+        for block in function.low_level_il:
+            for insn in block:
+                if insn.operation == LowLevelILOperation.LLIL_CALL:
+                    self.found.setdefault(function.start, []).append(hex(insn.address))  # comment
+        return len(self.found) > 0x10 and 'done' or "pending"
+
+'''.splitlines()
+
+
+def documentText(lines):
+    return "\n".join(sample[i % len(sample)] for i in range(lines))
+
+
+def elapsed(function):
+    start = time.perf_counter()
+    function()
+    return (time.perf_counter() - start) * 1000
+
+
+def summary(timings):
+    timings = sorted(timings)
+    return {
+        "mean": statistics.mean(timings),
+        "p50": timings[len(timings) // 2],
+        "p95": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "max": timings[-1],
+    }
+
+
+def settle(app, highlighter):
+    """Process events until any background lexing has been applied."""
+    app.processEvents()
+    if not hasattr(highlighter, "notifier"):
+        return
+    if not hasattr(highlighter, "benchApplied"):
+        highlighter.benchApplied = -1
+        def finished(revision, results):
+            highlighter.benchApplied = revision
+        highlighter.notifier.finished.connect(finished)
+    deadline = time.perf_counter() + 120
+    while highlighter.benchApplied != highlighter.revision and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.0005)
+    app.processEvents()
+
+
+def benchDocument(app, editorModule, highlighterClass, lines, keystrokes, scrollSteps):
+    from PySide6.QtCore import Qt
+    from PySide6.QtGui import QKeyEvent, QTextCursor
+    from PySide6.QtCore import QEvent
+
+    results = {}
+    text = documentText(lines)
+    editor = editorModule.QCodeEditor(SyntaxHighlighter=highlighterClass)
+    editor.resize(900, 700)
+    editor.show()
+
+    def openDocument():
+        editor.setPlainText(text)
+        settle(app, getattr(editor, "highlighter", None))
+    results["open"] = elapsed(openDocument)
+
+    cursor = editor.textCursor()
+    cursor.setPosition(editor.document().findBlockByNumber(lines // 2).position())
+    editor.setTextCursor(cursor)
+    typing = []
+    for i in range(keystrokes):
+        key = Qt.Key_A + (i % 26)
+        press = QKeyEvent(QEvent.KeyPress, key, Qt.NoModifier, chr(ord('a') + i % 26))
+        def typeKey():
+            app.sendEvent(editor, press)
+            editor.viewport().repaint()
+        typing.append(elapsed(typeKey))
+    results["keystroke"] = summary(typing)
+    settle(app, getattr(editor, "highlighter", None))
+
+    scrollBar = editor.verticalScrollBar()
+    scrollBar.setValue(0)
+    app.processEvents()
+    scrolling = []
+    for i in range(scrollSteps):
+        def scroll():
+            scrollBar.setValue(scrollBar.value() + scrollBar.pageStep())
+            editor.number_bar.repaint()
+            editor.viewport().repaint()
+        scrolling.append(elapsed(scroll))
+    results["scrollRepaint"] = summary(scrolling)
+
+    cursor = editor.textCursor()
+    cursor.movePosition(QTextCursor.Start)
+    cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+    editor.setTextCursor(cursor)
+    tab = QKeyEvent(QEvent.KeyPress, Qt.Key_Tab, Qt.NoModifier)
+    backtab = QKeyEvent(QEvent.KeyPress, Qt.Key_Backtab, Qt.ShiftModifier)
+    results["indent"] = elapsed(lambda: editor.keyPressEvent(tab))
+    results["dedent"] = elapsed(lambda: editor.keyPressEvent(backtab))
+
+    editor.close()
+    editor.deleteLater()
+    app.processEvents()
+    return results
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the snippet editor widget")
+    parser.add_argument("--lines", default="100,1000,10000,50000", help="Comma separated document sizes in lines")
+    parser.add_argument("--keystrokes", type=int, default=50, help="Keystrokes typed per document")
+    parser.add_argument("--scroll-steps", type=int, default=50, dest="scrollSteps", help="Page scrolls per document")
+    parser.add_argument("--json", dest="jsonPath", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    stubs.install()
+    from PySide6.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv)
+    plugin = stubs.loadPlugin()
+    editorModule = sys.modules[plugin.__name__ + ".QCodeEditor"]
+
+    highlighters = {"Pylighter": editorModule.Pylighter}
+    if editorModule.BackgroundPylighter is not None:
+        highlighters["BackgroundPylighter"] = editorModule.BackgroundPylighter
+
+    results = {}
+    for name, highlighterClass in highlighters.items():
+        results[name] = {}
+        for lines in [int(lines) for lines in args.lines.split(",")]:
+            result = benchDocument(app, editorModule, highlighterClass, lines, args.keystrokes, args.scrollSteps)
+            results[name][str(lines)] = result
+            print("%-20s %6d lines  open %9.1f ms  key p95 %7.2f ms  scroll p95 %7.2f ms  indent %8.1f ms  dedent %8.1f ms" % (
+                name, lines, result["open"], result["keystroke"]["p95"], result["scrollRepaint"]["p95"],
+                result["indent"], result["dedent"]))
+
+    if args.jsonPath:
+        with open(args.jsonPath, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
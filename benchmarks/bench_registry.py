@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Benchmarks for snippet discovery, loading and action registration.
+
+Runs against stubbed binaryninja/binaryninjaui modules (see stubs.py), so only
+PySide6 and pygments are needed:
+
+    python3 benchmarks/bench_registry.py                      # 100, 10k and 100k snippets
+    python3 benchmarks/bench_registry.py --sizes 100,10000 --save-baseline
+    python3 benchmarks/bench_registry.py --sizes 100,10000    # compare with the baseline
+
+Synthetic libraries are generated in a temporary folder with nested
+sub-folders. Each result is the best of --repeat runs in seconds. When a
+baseline exists, any timing more than --threshold times slower is reported
+as a regression and the script exits non-zero.
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+from argparse import ArgumentParser
+
+import stubs
+
+defaultBaseline = os.path.join(os.path.dirname(os.path.realpath(__file__)), "baseline_registry.json")
+
+
+def generateLibrary(root, count, perFolder=40, depth=3):
+    """Write `count` snippets under root, spread over `depth` levels of folders."""
+    paths = []
+    for i in range(count):
+        folder = i // perFolder
+        parts = []
+        for level in range(depth):
+            parts.append("group%d" % (folder % 10))
+            folder //= 10
+        folderPath = os.path.join(root, *parts)
+        os.makedirs(folderPath, exist_ok=True)
+        path = os.path.join(folderPath, "snippet_%06d.py" % i)
+        with open(path, "w", encoding="utf-8") as snippet:
+            hotkey = "Ctrl+Alt+Shift+F%d" % (i % 12 + 1) if i % 50 == 0 else ""
+            snippet.write("#Synthetic snippet %d\n#%s\n" % (i, hotkey))
+            snippet.write("for f in []:\n    print(f.name, hex(%d))\n" % i)
+            snippet.write("# filler\n" * (i % 20))
+        paths.append(path)
+    return paths
+
+
+def best(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def resetRegistry(plugin, indexPath):
+    if os.path.exists(indexPath):
+        os.unlink(indexPath)
+    plugin.snippetIndex = plugin.SnippetIndex(indexPath)
+    plugin.snippetRegistry = plugin.SnippetRegistry()
+    stubs.UIAction.registered.clear()
+
+
+def benchLibrary(plugin, root, count, repeat):
+    paths = generateLibrary(root, count)
+    plugin.snippetPath = root
+    indexPath = os.path.join(os.path.dirname(root), "bench_index.json")
+    results = {}
+
+    results["includeWalk"] = best(lambda: plugin.includeWalk(root, ".py"), repeat)
+    results["loadSnippetFromFile"] = best(lambda: [plugin.loadSnippetFromFile(path) for path in paths], repeat)
+
+    def cold():
+        resetRegistry(plugin, indexPath)
+        plugin.Snippets.registerAllSnippets()
+    results["registerAllSnippets (cold)"] = best(cold, repeat)
+    results["registerAllSnippets (warm)"] = best(plugin.Snippets.registerAllSnippets, repeat)
+
+    changed = paths[len(paths) // 2]
+    def reloadOnChange():
+        with open(changed, "a", encoding="utf-8") as snippet:
+            snippet.write("# edited\n")
+        plugin.Snippets.registerAllSnippets()
+    results["reload on change"] = best(reloadOnChange, repeat)
+
+    hot = paths[0]
+    def makeCold():
+        plugin.codeCache.invalidate()
+        plugin.makeSnippetFunction(hot)(None)
+    results["makeSnippetFunction (cold)"] = best(makeCold, repeat)
+    plugin.makeSnippetFunction(hot)(None)
+    results["makeSnippetFunction (hot)"] = best(lambda: plugin.makeSnippetFunction(hot)(None), repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for size, timings in results.items():
+        for name, seconds in timings.items():
+            previous = baseline.get(size, {}).get(name)
+            if previous and seconds > previous * threshold:
+                regressions.append((size, name, previous, seconds))
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark snippet discovery, loading and registration")
+    parser.add_argument("--sizes", default="100,10000,100000", help="Comma separated library sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the best is kept")
+    parser.add_argument("--baseline", default=defaultBaseline, help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", dest="saveBaseline", help="Store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown factor reported as a regression")
+    parser.add_argument("--json", dest="jsonPath", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    stubs.install()
+    plugin = stubs.loadPlugin()
+    workdir = tempfile.mkdtemp(prefix="snippets-bench-")
+    results = {}
+    try:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            root = os.path.join(workdir, "library%d" % size, "snippets")
+            results[str(size)] = benchLibrary(plugin, root, size, args.repeat)
+            for name, seconds in results[str(size)].items():
+                print("%8d  %-30s %10.3f ms" % (size, name, seconds * 1000))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.jsonPath:
+        with open(args.jsonPath, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+    if args.saveBaseline:
+        with open(args.baseline, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+        print("Saved baseline to %s" % args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as baselineFile:
+        regressions = compare(results, json.load(baselineFile), args.threshold)
+    for (size, name, previous, seconds) in regressions:
+        print("REGRESSION %s/%s: %.3f ms -> %.3f ms" % (size, name, previous * 1000, seconds * 1000))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
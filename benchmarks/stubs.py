@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Minimal stand-ins for the binaryninja and binaryninjaui modules.
+
+Just enough of the API is provided for the plugin to import and register its
+actions on a machine without Binary Ninja installed, so the benchmarks run
+anywhere PySide6 and pygments are available. Call install() before importing
+the plugin with loadPlugin().
+'''
+
+import os
+import sys
+import json
+import types
+import tempfile
+import importlib.util
+
+repoPath = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+class Settings:
+    registered = {}
+
+    def register_group(self, group, title):
+        return True
+
+    def register_setting(self, key, properties):
+        Settings.registered[key] = json.loads(properties)
+        return True
+
+    def default(self, key):
+        return Settings.registered.get(key, {}).get("default")
+
+    def get_bool(self, key):
+        return bool(self.default(key))
+
+    def get_string(self, key):
+        return self.default(key) or ""
+
+    def get_integer(self, key):
+        return int(self.default(key) or 0)
+
+
+class BackgroundTask:
+
+    def __init__(self, initial_progress_text="", can_cancel=False):
+        self.progress = initial_progress_text
+        self.can_cancel = can_cancel
+        self.cancelled = False
+        self.finished = False
+
+    def finish(self):
+        self.finished = True
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class BinaryDataNotification:
+
+    def __init__(self, notifications=None):
+        pass
+
+
+class Completer:
+
+    def complete(self, text, state):
+        return None
+
+
+class UIAction:
+    registered = {}
+
+    def __init__(self, activate=None, isValid=None):
+        self.activate = activate
+
+    @staticmethod
+    def registerAction(name, keys=None):
+        UIAction.registered[name] = keys
+
+    @staticmethod
+    def unregisterAction(name):
+        UIAction.registered.pop(name, None)
+
+    @staticmethod
+    def getAllRegisteredActions():
+        return list(UIAction.registered)
+
+
+class ActionHandler:
+
+    def __init__(self):
+        self.bound = {}
+
+    def bindAction(self, name, action):
+        self.bound[name] = action
+
+    def unbindAction(self, name):
+        self.bound.pop(name, None)
+
+    def executeAction(self, name, context=None):
+        self.bound[name].activate(context)
+
+
+class UIActionHandler:
+    handler = ActionHandler()
+
+    @staticmethod
+    def globalActions():
+        return UIActionHandler.handler
+
+
+class Menu:
+    menus = {}
+
+    def __init__(self):
+        self.actions = {}
+
+    @staticmethod
+    def mainMenu(name):
+        return Menu.menus.setdefault(name, Menu())
+
+    def addAction(self, name, group, weight=0):
+        self.actions[name] = group
+
+    def removeAction(self, name):
+        self.actions.pop(name, None)
+
+
+class UIContext:
+
+    @staticmethod
+    def activeContext():
+        return None
+
+    @staticmethod
+    def allContexts():
+        return [None]
+
+    @staticmethod
+    def registerNotification(notification):
+        pass
+
+
+class UIContextNotification:
+    pass
+
+
+class ThemeColorNames:
+    def __getattr__(self, name):
+        return name
+
+
+def getThemeColor(color):
+    from PySide6.QtGui import QColor
+    # Any stable colour per theme entry will do
+    return QColor("#%06x" % (hash(color) & 0xffffff))
+
+
+def getMonospaceFont(widget):
+    from PySide6.QtGui import QFont
+    return QFont("monospace")
+
+
+def install(pluginPath=None):
+    """Register the stub modules in sys.modules; returns the fake user plugin path."""
+    pluginPath = pluginPath or os.path.join(tempfile.mkdtemp(prefix="snippets-bench-"), "plugins")
+    os.makedirs(pluginPath, exist_ok=True)
+
+    def noop(*args, **kwargs):
+        return None
+
+    binaryninja = types.ModuleType("binaryninja")
+    binaryninja.__all__ = ["user_plugin_path", "core_version", "log_warn"]
+    binaryninja.user_plugin_path = lambda: pluginPath
+    binaryninja.core_version = lambda: "0.0.0"
+    binaryninja.execute_on_main_thread_and_wait = lambda function: function()
+    binaryninja.execute_on_main_thread = lambda function: function()
+    binaryninja.log_warn = noop
+    binaryninja.bncompleter = types.SimpleNamespace(Completer=Completer)
+
+    modules = {
+        "binaryninja": binaryninja,
+        "binaryninja.plugin": {"BackgroundTask": BackgroundTask},
+        "binaryninja.binaryview": {"BinaryDataNotification": BinaryDataNotification},
+        "binaryninja.log": {name: noop for name in ["log_error", "log_debug", "log_alert", "log_warn", "log_info"]},
+        "binaryninja.settings": {"Settings": Settings},
+        "binaryninja.interaction": {name: noop for name in ["get_directory_name_input", "get_save_filename_input",
+                                                            "show_plain_text_report", "show_markdown_report"]},
+        "binaryninja.variable": {"Variable": object},
+        "binaryninja.enums": {"FunctionGraphType": types.SimpleNamespace()},
+        "binaryninjaui": {"qt_major_version": 6, "getMonospaceFont": getMonospaceFont, "UIAction": UIAction,
+                          "UIActionHandler": UIActionHandler, "Menu": Menu, "UIContext": UIContext,
+                          "UIContextNotification": UIContextNotification,
+                          "getThemeColor": getThemeColor, "ThemeColor": ThemeColorNames()},
+    }
+    for name, contents in modules.items():
+        if isinstance(contents, dict):
+            module = types.ModuleType(name)
+            module.__dict__.update(contents)
+        else:
+            module = contents
+        sys.modules[name] = module
+    return pluginPath
+
+
+def loadPlugin(name="snippets"):
+    """Import the plugin package from this checkout under `name`."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(repoPath, "__init__.py"),
+                                                  submodule_search_locations=[repoPath])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Run a snippet over many binaries without the Binary Ninja UI.
+
+Each binary is opened in its own worker process, one BinaryView at a time, and
+a JSON line is written per binary as soon as it finishes:
+
+    python3 headless.py my_snippet.py /samples/*.exe -j 8 -o results.jsonl
+
+Snippets see the same globals as in the UI, with bv set and the UI/cursor ones
+set to None. Whatever a snippet leaves in its `result` global is reported. With
+--per-function the snippet runs once per function instead, as with "Run Per
+Function" in the UI. Needs a headless-capable Binary Ninja license; nothing here
+imports Qt, so run it as a script rather than through the plugin package.
+'''
+
+import os
+import sys
+import json
+import time
+import traceback
+import multiprocessing
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from .snippet_index import readSnippet
+    from .snippet_runtime import compileSnippet, viewGlobals, BatchSnippetTask
+except ImportError:
+    from snippet_index import readSnippet
+    from snippet_runtime import compileSnippet, viewGlobals, BatchSnippetTask
+
+import binaryninja
+
+
+workerSnippet = None
+
+
+def jsonable(value):
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return repr(value)
+
+
+def openView(binaryPath):
+    if hasattr(binaryninja, "load"):
+        return binaryninja.load(binaryPath)
+    return binaryninja.BinaryViewType.get_view_of_file(binaryPath)
+
+
+def initWorker(snippetPath, perFunction):
+    # Compile once per worker process rather than once per binary
+    global workerSnippet
+    (snippetDescription, snippetKeys, snippetCode, contentHash) = readSnippet(snippetPath)
+    workerSnippet = (snippetPath, compileSnippet(snippetCode, snippetPath), perFunction)
+
+
+def runOnBinary(binaryPath):
+    (snippetPath, code, perFunction) = workerSnippet
+    record = {"binary": binaryPath, "snippet": snippetPath, "ok": False, "result": None, "error": None}
+    start = time.perf_counter()
+    bv = None
+    try:
+        bv = openView(binaryPath)
+        if bv is None:
+            raise RuntimeError("Unable to open %s" % binaryPath)
+        if perFunction:
+            task = BatchSnippetTask(code, bv, snippetName=os.path.basename(snippetPath), workers=1)
+            task.run()
+            task.finish()
+            record["result"] = {"0x%x" % address: jsonable(value) for address, value in task.results.items()}
+            record["errors"] = {"0x%x" % address: error for address, error in task.errors.items()}
+            record["ok"] = not task.errors
+        else:
+            snippetGlobals = viewGlobals(bv).resolve(code)
+            exec(code, snippetGlobals)
+            record["result"] = jsonable(snippetGlobals.get('result'))
+            record["ok"] = True
+    except Exception:
+        record["error"] = traceback.format_exc()
+    finally:
+        if bv is not None:
+            bv.file.close()
+    record["wall_time"] = time.perf_counter() - start
+    return record
+
+
+def runHeadless(snippetPath, binaries, output=sys.stdout, jobs=None, perFunction=False):
+    """Run snippetPath over binaries with a process pool, writing one JSON line per binary.
+
+    Returns the number of binaries the snippet failed on."""
+    failures = 0
+    # Binary Ninja's core isn't fork-safe, always start fresh worker processes
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count(), mp_context=context,
+                             initializer=initWorker, initargs=(snippetPath, perFunction)) as executor:
+        futures = [executor.submit(runOnBinary, binary) for binary in binaries]
+        for future in as_completed(futures):
+            record = future.result()
+            if not record["ok"]:
+                failures += 1
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+    return failures
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Run a snippet over many binaries without the UI")
+    parser.add_argument("snippet", help="Snippet file to run")
+    parser.add_argument("binaries", nargs="+", help="Binaries (or saved databases) to run it on")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument("-o", "--output", default="-", help="JSONL file to write results to (default: stdout)")
+    parser.add_argument("--per-function", action="store_true", dest="perFunction", help="Run the snippet once per function")
+    args = parser.parse_args()
+
+    if args.output == "-":
+        failed = runHeadless(args.snippet, args.binaries, sys.stdout, args.jobs, args.perFunction)
+    else:
+        with open(args.output, "w", encoding="utf-8") as output:
+            failed = runHeadless(args.snippet, args.binaries, output, args.jobs, args.perFunction)
+    sys.exit(1 if failed else 0)
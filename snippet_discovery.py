@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Finds snippets below the snippet folder.
+
+The tree is walked with os.scandir and ignored folders are pruned before they
+are entered, so virtualenvs, caches and data kept next to the snippets cost
+nothing. Dot folders (.git, .venv, ...), __pycache__, venv and node_modules
+are always skipped. A .snippetignore file in any folder adds glob patterns,
+one per line with # for comments, for that folder and everything below it:
+
+    data/          folders only
+    *_scratch.py   any file or folder with a matching name
+    /big/tables    a path relative to the folder holding the .snippetignore
+'''
+
+import os
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+
+ignoreFileName = ".snippetignore"
+defaultIgnores = {"__pycache__", "venv", "node_modules"}
+
+
+def readIgnoreFile(folder):
+    """Parse folder's .snippetignore into [(folder, pattern, foldersOnly, anchored), ...]."""
+    rules = []
+    try:
+        with open(os.path.join(folder, ignoreFileName), 'r', encoding='utf-8') as ignoreFile:
+            for line in ignoreFile:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                foldersOnly = line.endswith('/')
+                anchored = '/' in line.rstrip('/')
+                pattern = line.strip('/')
+                if pattern:
+                    rules.append((folder, pattern, foldersOnly, anchored))
+    except (OSError, UnicodeDecodeError):
+        pass
+    return rules
+
+
+def ignored(path, name, isDir, rules):
+    if isDir and (name.startswith('.') or name in defaultIgnores):
+        return True
+    for (base, pattern, foldersOnly, anchored) in rules:
+        if foldersOnly and not isDir:
+            continue
+        if anchored:
+            target = os.path.relpath(path, base).replace(os.sep, '/')
+        else:
+            target = name
+        if fnmatch.fnmatch(target, pattern):
+            return True
+    return False
+
+
+def rulesAbove(root, folder):
+    """Collect the rules from .snippetignore files in root and every folder down to (not including) folder."""
+    rules = []
+    relative = os.path.relpath(folder, root)
+    if relative == os.curdir or relative.startswith(os.pardir):
+        return rules
+    current = root
+    for part in relative.split(os.sep):
+        rules += readIgnoreFile(current)
+        current = os.path.join(current, part)
+    return rules
+
+
+def scanLevel(folder, rules, includeExt):
+    """List one folder, returning (snippets, [(subfolder, rules), ...])."""
+    try:
+        with os.scandir(folder) as listing:
+            entries = list(listing)
+    except OSError:
+        return ([], [])
+    if any(entry.name == ignoreFileName for entry in entries):
+        rules = rules + readIgnoreFile(folder)
+    snippets = []
+    subfolders = []
+    for entry in entries:
+        try:
+            isDir = entry.is_dir(follow_symlinks=False)
+        except OSError:
+            continue
+        if ignored(entry.path, entry.name, isDir, rules):
+            continue
+        if isDir:
+            subfolders.append((entry.path, rules))
+        elif os.path.splitext(entry.name)[1] in includeExt:
+            snippets.append(entry.path)
+    return (snippets, subfolders)
+
+
+def scanFolders(pending, includeExt):
+    snippets = []
+    folders = []
+    while pending:
+        (folder, rules) = pending.pop()
+        folders.append(folder)
+        (found, subfolders) = scanLevel(folder, rules, includeExt)
+        snippets += found
+        pending += subfolders
+    return (snippets, folders)
+
+
+def scanTree(root, includeExt=".py", folder=None, workers=8):
+    """Return (snippets, folders) found below folder (root by default), both sorted.
+
+    Each top level sub-folder is walked on its own worker thread; scandir
+    releases the GIL while it waits on the file system."""
+    if isinstance(includeExt, str):
+        includeExt = (includeExt,)
+    folder = folder or root
+    (snippets, subfolders) = scanLevel(folder, rulesAbove(root, folder), includeExt)
+    folders = [folder]
+    if workers > 1 and len(subfolders) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(subfolders))) as executor:
+            results = list(executor.map(lambda subfolder: scanFolders([subfolder], includeExt), subfolders))
+    else:
+        results = [scanFolders(subfolders, includeExt)]
+    for (found, visited) in results:
+        snippets += found
+        folders += visited
+    return (sorted(snippets), sorted(folders))
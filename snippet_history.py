@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Append-only record of snippet runs.
+
+Every run is written as one JSON line so the file can be appended to from any
+thread or process and summarised later to find slow or failing snippets.
+'''
+
+import json
+import math
+import time
+import threading
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+class RunHistory:
+
+    def __init__(self, historyPath):
+        self.historyPath = historyPath
+        self.lock = threading.Lock()
+
+    def record(self, snippet, contentHash, view, wallTime, cpuTime, exception=None, analysisUpdated=False):
+        run = {
+            "time": time.time(),
+            "snippet": snippet,
+            "hash": contentHash,
+            "view": view,
+            "wall": wallTime,
+            "cpu": cpuTime,
+            "exception": exception,
+            "analysisUpdated": analysisUpdated,
+        }
+        with self.lock:
+            try:
+                with open(self.historyPath, 'a', encoding='utf-8') as historyFile:
+                    historyFile.write(json.dumps(run) + "\n")
+            except OSError:
+                pass
+
+    def runs(self):
+        """Yield every recorded run, oldest first, skipping damaged lines."""
+        try:
+            with open(self.historyPath, 'r', encoding='utf-8') as historyFile:
+                for line in historyFile:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except OSError:
+            return
+
+    def stats(self):
+        """Summarise runs per snippet.
+
+        Returns {snippet: {"count", "failures", "failureRate", "p50", "p95", "cpu", "lastRun"}}
+        with times in seconds."""
+        grouped = {}
+        for run in self.runs():
+            grouped.setdefault(run.get("snippet"), []).append(run)
+        summary = {}
+        for snippet, runs in grouped.items():
+            wall = sorted(run["wall"] for run in runs if run.get("wall") is not None)
+            failures = sum(1 for run in runs if run.get("exception"))
+            summary[snippet] = {
+                "count": len(runs),
+                "failures": failures,
+                "failureRate": failures / len(runs),
+                "p50": percentile(wall, 0.50),
+                "p95": percentile(wall, 0.95),
+                "cpu": sum(run.get("cpu") or 0 for run in runs) / len(runs),
+                "lastRun": max(run.get("time", 0) for run in runs),
+            }
+        return summary
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+On-disk index of snippet metadata.
+
+Registering snippets only needs the description and hotkey header lines, so
+they are cached here together with each file's mtime and size. At startup
+only files whose mtime or size changed are opened, and then only their header
+is read. Content hashes come from CodeCache, which reads the whole file anyway.
+'''
+
+import os
+import json
+import codecs
+import hashlib
+
+
+def parseSnippetText(snippetText):
+    """Split snippet text into (description, hotkey, code), all as strings."""
+    lines = snippetText.splitlines(True)
+    if (len(lines) < 3):
+        return ("", "", "")
+    return (lines[0].strip()[1:].strip(),
+            lines[1].strip()[1:],
+            ''.join(lines[2:])
+    )
+
+
+def readSnippet(snippetPath):
+    """Read a snippet file, returning (description, hotkey, code, contentHash)."""
+    try:
+        with open(snippetPath, 'rb') as snippetFile:
+            data = snippetFile.read()
+        snippetText = data.decode('utf-8')
+    except:
+        return ("", "", "", None)
+    return parseSnippetText(snippetText) + (hashlib.sha256(data).hexdigest(),)
+
+
+def readSnippetHeader(snippetPath, headerSize=4096):
+    """Read just enough of a snippet to register it.
+
+    Returns (description, hotkey, hasCode) without loading the body, or None
+    if the file can't be read. Headers longer than headerSize fall back to
+    reading the whole file."""
+    try:
+        with open(snippetPath, 'rb') as snippetFile:
+            data = snippetFile.read(headerSize)
+            complete = len(data) < headerSize
+            # The incremental decoder holds back a character cut in half at the end of the chunk
+            lines = codecs.getincrementaldecoder('utf-8')().decode(data, final=complete).splitlines(True)
+    except:
+        return None
+    if len(lines) >= 3:
+        return (lines[0].strip()[1:].strip(), lines[1].strip()[1:], True)
+    if complete:
+        return ("", "", False)
+    (description, hotkey, code, _) = readSnippet(snippetPath)
+    return (description, hotkey, bool(code))
+
+
+def fileHash(path):
+    """sha256 of a file's contents, or None if it can't be read."""
+    try:
+        with open(path, 'rb') as snippetFile:
+            return hashlib.sha256(snippetFile.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class SnippetIndex:
+    version = 3
+
+    def __init__(self, indexPath):
+        self.indexPath = indexPath
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.indexPath, 'r', encoding='utf-8') as indexFile:
+                data = json.load(indexFile)
+            if data.get("version") == self.version:
+                self.entries = data["snippets"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            self.entries = {}
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmpPath = self.indexPath + ".tmp"
+        try:
+            with open(tmpPath, 'w', encoding='utf-8') as indexFile:
+                json.dump({"version": self.version, "snippets": self.entries}, indexFile)
+            os.replace(tmpPath, self.indexPath)
+            self.dirty = False
+        except OSError:
+            pass
+
+    def lookup(self, snippetPath):
+        """Return the index entry for a snippet, re-parsing it only if it changed on disk."""
+        try:
+            stat = os.stat(snippetPath)
+        except OSError:
+            self.remove(snippetPath)
+            return None
+        entry = self.entries.get(snippetPath)
+        if entry is not None and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return entry
+        header = readSnippetHeader(snippetPath)
+        (description, hotkey, hasCode) = header if header is not None else ("", "", False)
+        entry = {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "description": description,
+            "hotkey": hotkey,
+            "code": hasCode,
+        }
+        self.entries[snippetPath] = entry
+        self.dirty = True
+        return entry
+
+    def remove(self, snippetPath):
+        if self.entries.pop(snippetPath, None) is not None:
+            self.dirty = True
+
+    def refresh(self, snippetPaths):
+        """Bring the index in line with snippetPaths and return [(path, entry), ...]."""
+        snippets = []
+        for snippetPath in snippetPaths:
+            entry = self.lookup(snippetPath)
+            if entry is not None:
+                snippets.append((snippetPath, entry))
+        present = set(snippetPaths)
+        for stale in [path for path in self.entries if path not in present]:
+            self.remove(stale)
+        self.save()
+        return snippets
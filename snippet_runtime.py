@@ -0,0 +1,736 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Runtime support for executing snippets.
+
+Nothing in this module depends on Qt or the Binary Ninja UI so it can be shared
+with headless runs.
+'''
+
+import os
+import sys
+import importlib
+import ctypes
+import heapq
+import itertools
+import marshal
+import hashlib
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from types import CodeType
+from importlib.util import MAGIC_NUMBER
+
+from binaryninja.log import (log_error, log_info, log_warn)
+from binaryninja.plugin import BackgroundTask
+from binaryninja.binaryview import BinaryDataNotification
+from binaryninja.variable import Variable
+from binaryninja.enums import FunctionGraphType
+
+try:
+    from .snippet_index import readSnippet
+    from .snippet_trace import tracer
+except ImportError:
+    from snippet_index import readSnippet
+    from snippet_trace import tracer
+
+
+def compileSnippet(snippetCode, snippetPath):
+    # Pad with the two header lines so line numbers in tracebacks match the file
+    return compile("# \n# \n" + snippetCode, snippetPath, 'exec')
+
+
+class CodeCache:
+    """LRU cache of compiled snippets keyed by path, mtime, size and content hash.
+
+    A hit only costs a stat() of the snippet; anything that writes a snippet
+    should invalidate() it, as mtime alone can miss a quick second save. When
+    cacheDir is set, compiled code is also marshalled to disk (like
+    __pycache__, one file per snippet holding the content hash it was compiled
+    from) so a changed mtime with the same content, or a fresh session, can
+    skip compile() as well."""
+
+    def __init__(self, maxEntries=64, cacheDir=None):
+        self.maxEntries = maxEntries
+        self.cacheDir = cacheDir
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, snippetPath):
+        """Return (description, code object) for snippetPath, compiling it only if it changed."""
+        try:
+            stat = os.stat(snippetPath)
+            key = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            key = None
+        with self.lock:
+            entry = self.entries.get(snippetPath)
+            if entry is not None and key is not None and entry[0] == key:
+                self.entries.move_to_end(snippetPath)
+                return entry[2], entry[3]
+
+        with tracer.span("loadSnippetFromFile", snippet=snippetPath):
+            (snippetDescription, snippetKeys, snippetCode, contentHash) = readSnippet(snippetPath)
+        code = self.loadBytecode(snippetPath, contentHash)
+        if code is None:
+            with tracer.span("compile", snippet=snippetPath):
+                code = compileSnippet(snippetCode, snippetPath)
+            self.storeBytecode(snippetPath, contentHash, code)
+
+        with self.lock:
+            self.entries[snippetPath] = (key, contentHash, snippetDescription, code)
+            self.entries.move_to_end(snippetPath)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+        return snippetDescription, code
+
+    def contentHash(self, snippetPath):
+        """Return the content hash recorded when snippetPath was last compiled."""
+        with self.lock:
+            entry = self.entries.get(snippetPath)
+            return entry[1] if entry is not None else None
+
+    def invalidate(self, snippetPath=None):
+        with self.lock:
+            if snippetPath is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(snippetPath, None)
+
+    def bytecodePath(self, snippetPath):
+        name = hashlib.sha256(snippetPath.encode('utf-8')).hexdigest()
+        return os.path.join(self.cacheDir, name[:32] + ".pyc")
+
+    def loadBytecode(self, snippetPath, contentHash):
+        if self.cacheDir is None or contentHash is None:
+            return None
+        header = MAGIC_NUMBER + contentHash.encode('ascii')
+        try:
+            with open(self.bytecodePath(snippetPath), 'rb') as cacheFile:
+                data = cacheFile.read()
+            if data[:len(header)] != header:
+                return None
+            return marshal.loads(data[len(header):])
+        except (OSError, ValueError, EOFError, TypeError):
+            return None
+
+    def storeBytecode(self, snippetPath, contentHash, code):
+        # Each snippet has a single cache file, so a new version replaces the old one
+        if self.cacheDir is None or contentHash is None:
+            return
+        try:
+            os.makedirs(self.cacheDir, exist_ok=True)
+            cachePath = self.bytecodePath(snippetPath)
+            tmpPath = "%s.%d.tmp" % (cachePath, os.getpid())
+            with open(tmpPath, 'wb') as cacheFile:
+                cacheFile.write(MAGIC_NUMBER + contentHash.encode('ascii') + marshal.dumps(code))
+            os.replace(tmpPath, cachePath)
+        except OSError:
+            pass
+
+
+class NamespaceTemplate:
+    """The names `from <module> import *` binds, built once and shared by every run.
+
+    The template is rebuilt if the module is reloaded, which rebinds __all__."""
+
+    def __init__(self, moduleName):
+        self.moduleName = moduleName
+        self.module = None
+        self.exported = None
+        self.names = {}
+        self.lock = threading.Lock()
+
+    def get(self):
+        module = sys.modules.get(self.moduleName)
+        if module is None:
+            module = importlib.import_module(self.moduleName)
+        exported = getattr(module, '__all__', None)
+        with self.lock:
+            if module is not self.module or exported is not self.exported:
+                names = {}
+                exec("from %s import *" % self.moduleName, names)
+                names.pop('__builtins__', None)
+                self.names = names
+                self.module = module
+                self.exported = exported
+            return self.names
+
+binaryninjaNamespace = NamespaceTemplate("binaryninja")
+
+
+# Calling any of these gives a snippet access to globals it doesn't name
+dynamicLookups = frozenset(["globals", "locals", "vars", "eval", "exec"])
+
+
+@lru_cache(maxsize=256)
+def globalNames(code):
+    """Every name code, or a function, class or comprehension nested in it, can look up as a global."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names |= globalNames(const)
+    return frozenset(names)
+
+
+class LazyGlobals:
+    """Snippet globals whose expensive values are only computed when used.
+
+    Values are collected with item assignment and lazy(), then resolve(code)
+    builds the plain dict a snippet runs with: a copy of `base` (the
+    binaryninja star import), the values, and the lazy values the compiled
+    snippet refers to. Snippets that call globals(), eval() and the like get
+    every lazy value."""
+
+    def __init__(self, base=None):
+        self.base = base or {}
+        self.values = {}
+        self.factories = {}
+
+    def __setitem__(self, name, value):
+        self.factories.pop(name, None)
+        self.values[name] = value
+
+    def lazy(self, name, factory):
+        self.values.pop(name, None)
+        self.factories[name] = factory
+
+    def resolve(self, code):
+        snippetGlobals = dict(self.base)
+        snippetGlobals.update(self.values)
+        names = globalNames(code)
+        everything = not dynamicLookups.isdisjoint(names)
+        for (name, factory) in self.factories.items():
+            if everything or name in names:
+                snippetGlobals[name] = factory()
+        return snippetGlobals
+
+
+def estimateSize(value, depth=3, sample=32):
+    """Rough deep size of value in bytes. Containers are sampled rather than walked in full."""
+    size = sys.getsizeof(value)
+    if depth == 0 or isinstance(value, (str, bytes, bytearray)):
+        return size
+    if isinstance(value, dict):
+        items = list(itertools.islice(value.items(), sample))
+        sampled = sum(estimateSize(key, depth - 1) + estimateSize(item, depth - 1) for (key, item) in items)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = list(itertools.islice(value, sample))
+        sampled = sum(estimateSize(item, depth - 1) for item in items)
+    else:
+        return size
+    if items:
+        size += sampled * len(value) // len(items)
+    return size
+
+
+class CacheInvalidator(BinaryDataNotification):
+    """Drops a view's cached snippet results whenever its contents or analysis change."""
+
+    def __init__(self, store, viewKey):
+        BinaryDataNotification.__init__(self)
+        self.store = store
+        self.viewKey = viewKey
+
+    def changed(self, *args):
+        self.store.invalidate(self.viewKey)
+
+    data_written = data_inserted = data_removed = changed
+    function_added = function_removed = function_updated = changed
+    data_var_added = data_var_removed = data_var_updated = changed
+    symbol_added = symbol_removed = symbol_updated = changed
+    type_defined = type_undefined = changed
+
+
+class ResultCache:
+    """Values snippets keep between runs, shared by all snippets up to maxBytes (0 disables it).
+
+    Entries are keyed by (view, snippet, key) and evicted least recently used
+    first; sizes are estimated when a value is stored. The first entry for a
+    view registers a CacheInvalidator on it. The view is released again once
+    it has no entries left, or when releaseFile() is called as its file closes."""
+
+    def __init__(self, maxBytes=128 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.byView = {}
+        self.views = {}
+        self.idle = set()
+        self.lock = threading.RLock()
+        # Held while (un)registering notifications, which mustn't happen under
+        # self.lock as the notification callbacks take it
+        self.registering = threading.Lock()
+
+    @staticmethod
+    def viewKey(bv):
+        return None if bv is None else hash(bv)
+
+    def scope(self, bv, snippet):
+        self.sweep()
+        return SnippetCache(self, bv, snippet)
+
+    def get(self, bv, snippet, key, default=None):
+        entryKey = (self.viewKey(bv), snippet, key)
+        with self.lock:
+            entry = self.entries.get(entryKey)
+            if entry is None:
+                return default
+            self.entries.move_to_end(entryKey)
+            return entry[0]
+
+    def set(self, bv, snippet, key, value):
+        if self.maxBytes == 0:
+            # Caching is turned off
+            return
+        size = estimateSize(value)
+        viewKey = self.viewKey(bv)
+        entryKey = (viewKey, snippet, key)
+        if size > self.maxBytes:
+            self.discard(entryKey)
+            log_warn("Snippets: Not caching %r for %s, it is larger than the snippet cache" % (key, snippet))
+            return
+        while True:
+            if bv is not None:
+                self.watch(bv, viewKey)
+            with self.lock:
+                # The view may have been released again before we got the lock
+                if bv is not None and viewKey not in self.views:
+                    continue
+                self.discard(entryKey)
+                self.entries[entryKey] = (value, size)
+                self.size += size
+                self.byView.setdefault(viewKey, set()).add(entryKey)
+                self.idle.discard(viewKey)
+                while self.size > self.maxBytes:
+                    self.discard(next(iter(self.entries)))
+                return
+
+    def watch(self, bv, viewKey):
+        with self.registering:
+            with self.lock:
+                if viewKey in self.views:
+                    return
+                notification = CacheInvalidator(self, viewKey)
+                self.views[viewKey] = (bv, notification)
+                self.idle.discard(viewKey)
+            bv.register_notification(notification)
+
+    def discard(self, entryKey):
+        with self.lock:
+            entry = self.entries.pop(entryKey, None)
+            if entry is None:
+                return
+            self.size -= entry[1]
+            viewEntries = self.byView[entryKey[0]]
+            viewEntries.discard(entryKey)
+            if not viewEntries:
+                del self.byView[entryKey[0]]
+                self.idle.add(entryKey[0])
+
+    def keys(self, bv, snippet):
+        viewKey = self.viewKey(bv)
+        with self.lock:
+            return [key for (entryView, entrySnippet, key) in self.byView.get(viewKey, ()) if entrySnippet == snippet]
+
+    def clear(self, bv, snippet):
+        viewKey = self.viewKey(bv)
+        with self.lock:
+            for entryKey in [entryKey for entryKey in self.byView.get(viewKey, ()) if entryKey[1] == snippet]:
+                self.discard(entryKey)
+
+    def invalidate(self, viewKey):
+        with self.lock:
+            for entryKey in list(self.byView.get(viewKey, ())):
+                self.discard(entryKey)
+
+    def releaseFile(self, file):
+        """Drop everything cached for the views of file and stop watching them."""
+        with self.lock:
+            for (viewKey, (bv, notification)) in list(self.views.items()):
+                if bv.file == file:
+                    self.invalidate(viewKey)
+                    self.idle.add(viewKey)
+        self.sweep()
+
+    def sweep(self):
+        # Unregistering from inside a notification callback isn't safe, so
+        # views left empty by invalidate() are released on the next run instead
+        with self.registering:
+            with self.lock:
+                released = [self.views.pop(viewKey) for viewKey in self.idle if viewKey in self.views and viewKey not in self.byView]
+                self.idle.clear()
+            for (bv, notification) in released:
+                try:
+                    bv.unregister_notification(notification)
+                except Exception:
+                    pass
+
+
+class SnippetCache:
+    """The snippet_cache global: a dict-like store for one snippet and view that outlives a run.
+
+        xrefs = snippet_cache.cached("xrefs", lambda: build_xref_map(bv))
+
+    Entries disappear when the view changes or the cache runs out of room, so
+    always be prepared to compute a value again."""
+
+    missing = object()
+
+    def __init__(self, store, bv, snippet):
+        self.store = store
+        self.bv = bv
+        self.snippet = snippet
+
+    def get(self, key, default=None):
+        return self.store.get(self.bv, self.snippet, key, default)
+
+    def cached(self, key, factory):
+        """Return the value stored under key, calling factory() to compute and store it on a miss."""
+        value = self.store.get(self.bv, self.snippet, key, self.missing)
+        if value is self.missing:
+            value = factory()
+            self.store.set(self.bv, self.snippet, key, value)
+        return value
+
+    def keys(self):
+        return self.store.keys(self.bv, self.snippet)
+
+    def clear(self):
+        self.store.clear(self.bv, self.snippet)
+
+    def __getitem__(self, key):
+        value = self.store.get(self.bv, self.snippet, key, self.missing)
+        if value is self.missing:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store.set(self.bv, self.snippet, key, value)
+
+    def __delitem__(self, key):
+        self.store.discard((self.store.viewKey(self.bv), self.snippet, key))
+
+    def __contains__(self, key):
+        return self.store.get(self.bv, self.snippet, key, self.missing) is not self.missing
+
+
+def ilFunctionForView(function, ilType):
+    """Return the IL function shown by an IL view of the given FunctionGraphType."""
+    if ilType == FunctionGraphType.LowLevelILFunctionGraph and function.llil_if_available:
+        return function.llil_if_available
+    elif ilType == FunctionGraphType.LowLevelILSSAFormFunctionGraph and function.llil_if_available:
+        return function.llil_if_available.ssa_form
+    elif ilType == FunctionGraphType.MediumLevelILFunctionGraph and function.mlil_if_available:
+        return function.mlil_if_available
+    elif ilType == FunctionGraphType.MediumLevelILSSAFormFunctionGraph and function.mlil_if_available:
+        return function.mlil_if_available.ssa_form
+    elif ilType == FunctionGraphType.HighLevelILFunctionGraph and function.hlil_if_available:
+        return function.hlil_if_available
+    elif ilType == FunctionGraphType.HighLevelILSSAFormFunctionGraph and function.hlil_if_available:
+        return function.hlil_if_available.ssa_form
+    return None
+
+
+# Every snippet can rely on these being defined, None when they don't apply
+snippetGlobalNames = ['current_view', 'bv', 'current_function', 'current_token', 'current_address', 'here',
+                      'current_selection', 'current_raw_offset', 'current_basic_block', 'current_llil',
+                      'current_mlil', 'current_hlil', 'current_il_index', 'current_il_function',
+                      'current_il_instruction', 'current_il_basic_block', 'current_il_instructions',
+                      'current_variable', 'current_ui_action_context', 'current_ui_context']
+
+
+def baseGlobals(bv, function=None, address=None, resultCache=None, snippet=None):
+    """Build the globals for a view, optionally at a function and address, that need no UI.
+
+    IL, basic blocks and other values that need analysis are only computed if
+    the snippet actually refers to them. With a resultCache, snippet_cache is
+    scoped to bv and `snippet`."""
+    with tracer.span("binaryninja namespace"):
+        snippetGlobals = LazyGlobals(base=binaryninjaNamespace.get())
+    for name in snippetGlobalNames:
+        snippetGlobals[name] = None
+    snippetGlobals['current_view'] = bv
+    snippetGlobals['bv'] = bv
+    snippetGlobals['current_address'] = address
+    snippetGlobals['here'] = address
+
+    if function:
+        snippetGlobals['current_function'] = function
+        snippetGlobals.lazy('current_mlil', lambda: function.mlil_if_available)
+        snippetGlobals.lazy('current_hlil', lambda: function.hlil_if_available)
+        snippetGlobals.lazy('current_llil', lambda: function.llil_if_available)
+        if address is not None:
+            snippetGlobals.lazy('current_basic_block', lambda: function.get_basic_block_at(address))
+    if bv is not None and address is not None:
+        snippetGlobals.lazy('current_raw_offset', lambda: bv.get_data_offset_for_address(address))
+    if resultCache is not None:
+        snippetGlobals.lazy('snippet_cache', lambda: resultCache.scope(bv, snippet))
+    return snippetGlobals
+
+
+def setupGlobals(uiactioncontext, uicontext, resultCache=None, snippet=None):
+    """Build the globals a snippet run from the UI starts with.
+
+    Adds what the UI knows (token, selection, IL view position) to
+    baseGlobals(). Anything that has to query the UI is read here, on the
+    calling thread."""
+    function = uiactioncontext.function
+    address = uiactioncontext.address
+    bv = uiactioncontext.binaryView
+    snippetGlobals = baseGlobals(bv, function, address, resultCache, snippet)
+
+    view_frame = None
+    view = None
+    if uicontext is not None:
+        view_frame = uicontext.getCurrentViewFrame()
+        view = uicontext.getCurrentView()
+
+    view_location = view_frame.getViewLocation() if view_frame is not None else None
+
+    if view is not None:
+        snippetGlobals['current_il_index'] = view.getSelectionStartILInstructionIndex()
+
+    if function and uiactioncontext.token:
+        # Doubly nested because the first token is a HighlightTokenState
+        snippetGlobals['current_token'] = uiactioncontext.token
+
+    if address is not None and isinstance(uiactioncontext.length, int):
+        snippetGlobals['current_selection'] = (address, address+uiactioncontext.length)
+    snippetGlobals['current_ui_action_context'] = uiactioncontext
+    snippetGlobals['current_ui_context'] = uicontext
+
+    if view_location is not None and view_location.isValid():
+        active_il_index = view_location.getInstrIndex()
+        ilType = view_location.getILViewType()
+        il_start = view.getSelectionStartILInstructionIndex() if view is not None else active_il_index
+
+        @lru_cache(maxsize=None)
+        def activeILFunction():
+            return ilFunctionForView(function, ilType) if function else None
+
+        def activeILInstructions():
+            if not activeILFunction():
+                return None
+            return (activeILFunction()[i] for i in range(
+                min(il_start, active_il_index),
+                max(il_start, active_il_index) + 1)
+            )
+
+        snippetGlobals.lazy('current_il_function', activeILFunction)
+        snippetGlobals.lazy('current_il_instruction', lambda: activeILFunction()[active_il_index] if activeILFunction() else None)
+        snippetGlobals.lazy('current_il_basic_block', lambda: activeILFunction()[active_il_index].il_basic_block if activeILFunction() else None)
+        snippetGlobals.lazy('current_il_instructions', activeILInstructions)
+
+        token_state = uiactioncontext.token
+        var = token_state.localVar if token_state and token_state.localVarValid else None
+        if var and function:
+            snippetGlobals.lazy('current_variable', lambda: Variable.from_core_variable(function, var))
+        else:
+            snippetGlobals['current_variable'] = var
+
+    return snippetGlobals
+
+
+def viewGlobals(bv, resultCache=None, snippet=None):
+    """Build the globals for running a snippet against a whole view, without a UI."""
+    return baseGlobals(bv, resultCache=resultCache, snippet=snippet)
+
+
+def functionGlobals(bv, function, resultCache=None, snippet=None):
+    """Build the globals for running a snippet against one function, without a UI."""
+    return baseGlobals(bv, function, function.start, resultCache, snippet)
+
+
+class BatchSnippetTask(BackgroundTask):
+    """Runs a compiled snippet once per function, spread over a thread pool.
+
+    Functions are split into chunks that worker threads take in turn. Whatever
+    a snippet leaves in its `result` global is collected in results, keyed by
+    the function's start address, and exceptions are collected in errors the
+    same way. Cancelling the task stops the workers after their current function."""
+
+    def __init__(self, code, bv, functions=None, snippetName="Snippet", workers=None, chunkSize=None, updateAnalysis=False,
+                 resultCache=None, snippet=None):
+        BackgroundTask.__init__(self, f"{snippetName}...", True)
+        self.name = snippetName
+        self.code = code
+        self.bv = bv
+        self.functions = functions
+        self.workers = workers or os.cpu_count() or 1
+        self.chunkSize = chunkSize
+        self.updateAnalysis = updateAnalysis
+        self.resultCache = resultCache
+        self.snippet = snippet
+        self.results = {}
+        self.errors = {}
+        self.completed = 0
+        self.total = 0
+        self.lock = threading.Lock()
+        self.complete = threading.Event()
+
+    def runChunk(self, chunk):
+        for function in chunk:
+            if self.cancelled:
+                return
+            try:
+                snippetGlobals = functionGlobals(self.bv, function, self.resultCache, self.snippet).resolve(self.code)
+                with tracer.span("snippet", function="0x%x" % function.start):
+                    exec(self.code, snippetGlobals)
+                with self.lock:
+                    self.results[function.start] = snippetGlobals.get('result')
+            except Exception:
+                with self.lock:
+                    self.errors[function.start] = traceback.format_exc()
+            with self.lock:
+                self.completed += 1
+                self.progress = "%s: %d/%d functions" % (self.name, self.completed, self.total)
+
+    def run(self):
+        try:
+            functions = list(self.functions if self.functions is not None else self.bv.functions)
+            self.total = len(functions)
+            chunkSize = self.chunkSize or max(1, min(256, len(functions) // (self.workers * 4)))
+            chunks = [functions[i:i + chunkSize] for i in range(0, len(functions), chunkSize)]
+            self.bv.begin_undo_actions()
+            try:
+                with tracer.span("batch", snippet=self.name, functions=len(functions)):
+                    with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                        for future in [executor.submit(self.runChunk, chunk) for chunk in chunks]:
+                            future.result()
+                if self.updateAnalysis:
+                    with tracer.span("update_analysis_and_wait"):
+                        self.bv.update_analysis_and_wait()
+            finally:
+                self.bv.commit_undo_actions()
+            log_info("Snippets: %s ran on %d/%d functions, %d failed" % (self.name, self.completed, self.total, len(self.errors)))
+            for start, error in list(self.errors.items())[:5]:
+                log_warn("Snippets: %s failed on function at 0x%x\n%s" % (self.name, start, error))
+        finally:
+            self.complete.set()
+
+    def wait(self, timeout=None):
+        """Block until the batch has finished; returns False on timeout."""
+        return self.complete.wait(timeout)
+
+
+class SnippetCancelled(Exception):
+    """Raised inside a running snippet when its task is cancelled from the task list."""
+
+
+class SnippetScheduler:
+    """Runs snippet tasks on a fixed pool of persistent worker threads.
+
+    Tasks are BackgroundTasks with a run() method. They are created when a run
+    is requested, so waiting runs show up in the task list straight away.
+    Pending tasks are ordered by priority (highest first, FIFO among equals) and
+    submitting a snippet that is already waiting replaces the waiting run
+    instead of queueing another copy. Cancelling from the task list drops a
+    waiting task, or raises SnippetCancelled inside a running one at its next
+    Python instruction."""
+
+    def __init__(self, workers=1, pollInterval=0.25):
+        self.lock = threading.Condition()
+        self.queue = []
+        self.pending = {}
+        self.running = {}
+        self.signaled = set()
+        self.sequence = itertools.count()
+        self.pollInterval = pollInterval
+        self.workers = [threading.Thread(target=self.work, name="Snippet worker %d" % i, daemon=True) for i in range(max(1, workers))]
+        for worker in self.workers:
+            worker.start()
+        self.monitor = threading.Thread(target=self.watchCancellation, name="Snippet cancel monitor", daemon=True)
+        self.monitor.start()
+
+    # Queue entries are [-priority, sequence, uid, task, key]; task is set to None
+    # when an entry is dropped so it can be skipped when it reaches the top.
+    def submit(self, task, key=None, priority=0):
+        """Queue task; a pending task with the same key is replaced by it."""
+        with self.lock:
+            previous = self.pending.get(key) if key is not None else None
+            if previous is not None:
+                # Coalesce with the waiting run, keeping its place in the queue
+                sequence = previous[1]
+                priority = max(priority, -previous[0])
+                self.drop(previous)
+            else:
+                sequence = next(self.sequence)
+            entry = [-priority, sequence, next(self.sequence), task, key]
+            heapq.heappush(self.queue, entry)
+            if key is not None:
+                self.pending[key] = entry
+            task.progress = "Queued: %s" % task.name
+            self.lock.notify_all()
+
+    def drop(self, entry):
+        entry[3].finish()
+        entry[3] = None
+        if self.pending.get(entry[4]) is entry:
+            del self.pending[entry[4]]
+
+    def queued(self):
+        """Return the waiting tasks in the order they will run."""
+        with self.lock:
+            return [entry[3] for entry in sorted(self.queue) if entry[3] is not None]
+
+    def next(self):
+        with self.lock:
+            while True:
+                while not self.queue:
+                    self.lock.wait()
+                entry = heapq.heappop(self.queue)
+                task = entry[3]
+                if task is None:
+                    continue
+                if task.cancelled:
+                    self.drop(entry)
+                    continue
+                if self.pending.get(entry[4]) is entry:
+                    del self.pending[entry[4]]
+                self.running[threading.get_ident()] = task
+                self.lock.notify_all()
+                return task
+
+    def done(self, task):
+        with self.lock:
+            self.running.pop(threading.get_ident(), None)
+            self.signaled.discard(task)
+        if not task.finished:
+            task.finish()
+
+    def runTask(self, task):
+        try:
+            task.progress = "%s..." % task.name
+            task.run()
+        except SnippetCancelled:
+            log_info("Snippets: %s was cancelled" % task.name)
+        except Exception:
+            log_error("Snippets: %s failed\n%s" % (task.name, traceback.format_exc()))
+        finally:
+            self.done(task)
+
+    def work(self):
+        while True:
+            task = self.next()
+            try:
+                self.runTask(task)
+            except SnippetCancelled:
+                # The cancel landed just as the snippet was finishing
+                self.done(task)
+
+    def watchCancellation(self):
+        while True:
+            with self.lock:
+                while not self.queue and not self.running:
+                    self.lock.wait()
+                for entry in self.queue:
+                    if entry[3] is not None and entry[3].cancelled:
+                        self.drop(entry)
+                for ident, task in self.running.items():
+                    if task.cancelled and task not in self.signaled:
+                        self.signaled.add(task)
+                        ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(ident), ctypes.py_object(SnippetCancelled))
+                self.lock.wait(self.pollInterval)
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Snippet search.
+
+FuzzyIndex is an in-memory fuzzy search over snippet file names, descriptions
+and folders. The index is kept in step with the snippet index by update(), which only
+touches snippets that were added, removed or re-described, and defers the
+indexing work to the first search. Each entry carries
+the set of characters it contains so most snippets are rejected with a
+single subset test, and a query that extends the previous one only searches
+the previous matches.
+
+TrigramIndex searches snippet bodies for a substring or regular expression.
+It keeps the set of lower-cased trigrams of every snippet on disk, so only
+snippets that changed since the last session are re-read, and a query only
+reads the files containing every trigram of the literal text it requires.
+The index file is only loaded by the first search, and posting sets are built
+per trigram the first time it is searched for.
+'''
+
+import os
+import re
+import json
+import heapq
+from collections import namedtuple
+try:
+    import re._parser as sre_parse
+except ImportError:
+    import sre_parse
+
+SearchEntry = namedtuple("SearchEntry", ["description", "chars", "fields"])
+
+# Matches right after one of these count as the start of a word
+boundaries = set(" _-./\\")
+# Weights for the name, description and folder fields
+nameWeight = 3
+descriptionWeight = 2
+folderWeight = 1
+
+
+def fuzzyScore(term, text):
+    """Score lower case term against lower case text, None if it isn't a subsequence of it."""
+    index = text.find(term)
+    if index >= 0:
+        score = 100 + 10 * len(term) - min(index, 50)
+        if index == 0 or text[index - 1] in boundaries:
+            score += 50
+        return score
+    score = 0
+    position = -1
+    for char in term:
+        previous = position
+        position = text.find(char, position + 1)
+        if position < 0:
+            return None
+        if position == previous + 1:
+            score += 8
+        elif position == 0 or text[position - 1] in boundaries:
+            score += 6
+        else:
+            score += 1
+    return score
+
+
+class FuzzyIndex:
+
+    def __init__(self, root):
+        self.root = root
+        self.prefix = os.path.join(root, "")
+        self.entries = {}
+        self.pending = {}
+        self.generation = 0
+        self.lastQuery = None
+        self.lastMatches = None
+
+    def add(self, path, description):
+        # relpath is slow enough to matter when indexing a whole library
+        relative = path[len(self.prefix):] if path.startswith(self.prefix) else os.path.relpath(path, self.root)
+        (folder, name) = os.path.split(relative.lower())
+        name = os.path.splitext(name)[0]
+        folder = folder.replace(os.sep, "/")
+        fields = ((name, nameWeight), (description.lower(), descriptionWeight), (folder, folderWeight))
+        self.entries[path] = SearchEntry(description, frozenset(name + fields[1][0] + folder), fields)
+        self.generation += 1
+
+    def remove(self, path):
+        self.pending.pop(path, None)
+        if self.entries.pop(path, None) is not None:
+            self.generation += 1
+
+    def update(self, snippets):
+        """Sync with [(path, indexEntry), ...] from SnippetIndex.refresh(), skipping snippets without code.
+
+        New and changed snippets are only queued here and indexed by the next
+        search, so registering snippets at startup doesn't pay for it."""
+        wanted = {path: entry["description"] for (path, entry) in snippets if entry["code"]}
+        for path in [path for path in self.entries if path not in wanted]:
+            self.remove(path)
+        for path in [path for path in self.pending if path not in wanted]:
+            del self.pending[path]
+        for (path, description) in wanted.items():
+            current = self.entries.get(path)
+            if current is None or current.description != description:
+                self.pending[path] = description
+
+    def flush(self):
+        for (path, description) in self.pending.items():
+            self.add(path, description)
+        self.pending = {}
+
+    def score(self, terms, entry):
+        total = 0
+        for term in terms:
+            best = None
+            for (text, weight) in entry.fields:
+                score = fuzzyScore(term, text)
+                if score is not None and (best is None or score * weight > best):
+                    best = score * weight
+            if best is None:
+                return None
+            total += best
+        return total
+
+    def search(self, query, limit=50):
+        """Return up to limit [(score, path, description), ...], best match first."""
+        self.flush()
+        terms = query.lower().split()
+        if not terms:
+            return []
+        candidates = self.entries.keys()
+        if self.lastQuery is not None and self.lastQuery[1] == self.generation and query.lower().startswith(self.lastQuery[0]):
+            candidates = self.lastMatches
+        chars = frozenset("".join(terms))
+        matches = []
+        for path in candidates:
+            entry = self.entries[path]
+            if not chars <= entry.chars:
+                continue
+            score = self.score(terms, entry)
+            if score is not None:
+                matches.append((score, path, entry.description))
+        self.lastQuery = (query.lower(), self.generation)
+        self.lastMatches = [path for (score, path, description) in matches]
+        return heapq.nsmallest(limit, matches, key=lambda match: (-match[0], len(match[1]), match[1]))
+
+
+def textTrigrams(text):
+    """The set of lower case three character sequences in text that don't span a line break."""
+    text = text.lower()
+    return {trigram for trigram in set(map("".join, zip(text, text[1:], text[2:]))) if "\n" not in trigram and "\r" not in trigram}
+
+
+def requiredLiterals(pattern, flags=0):
+    """Literal strings any match of a regex has to contain, as far as a walk of its parse tree can tell."""
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except Exception:
+        return []
+    literals = []
+    def walk(items):
+        run = []
+        for (op, av) in items:
+            if op is sre_parse.LITERAL:
+                run.append(chr(av))
+                continue
+            literals.append("".join(run))
+            run = []
+            if op is sre_parse.SUBPATTERN:
+                walk(av[-1])
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+                walk(av[2])
+        literals.append("".join(run))
+    walk(parsed)
+    return [literal for literal in literals if len(literal) >= 3]
+
+
+def hasTrigram(trigrams, trigram):
+    """Check a run of sorted, concatenated trigrams for trigram."""
+    index = trigrams.find(trigram)
+    while index >= 0 and index % 3:
+        index = trigrams.find(trigram, index + 1)
+    return index >= 0
+
+
+class TrigramIndex:
+    version = 1
+
+    def __init__(self, indexPath):
+        self.indexPath = indexPath
+        # None until the first search loads the index file
+        self.files = None
+        # Posting sets are only built for trigrams that have been searched for
+        self.postings = {}
+        self.pending = {}
+        # What update() and remove() were told before the index was loaded
+        self.listing = None
+        self.removed = set()
+        self.dirty = False
+
+    def load(self):
+        try:
+            with open(self.indexPath, 'r', encoding='utf-8') as indexFile:
+                data = json.load(indexFile)
+            if data.get("version") == self.version:
+                self.files = data["files"]
+            else:
+                self.files = {}
+        except (OSError, ValueError, KeyError, AttributeError):
+            self.files = {}
+        for path in self.removed:
+            self.remove(path)
+        self.removed = set()
+        if self.listing is not None:
+            (listing, self.listing) = (self.listing, None)
+            self.update(listing)
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmpPath = self.indexPath + ".tmp"
+        try:
+            with open(tmpPath, 'w', encoding='utf-8') as indexFile:
+                json.dump({"version": self.version, "files": self.files}, indexFile)
+            os.replace(tmpPath, self.indexPath)
+            self.dirty = False
+        except OSError:
+            pass
+
+    def update(self, snippets):
+        """Sync with [(path, indexEntry), ...] from SnippetIndex.refresh().
+
+        Changed snippets are only queued here and re-read by the next search."""
+        if self.files is None:
+            self.listing = list(snippets)
+            return
+        present = set()
+        for (path, entry) in snippets:
+            present.add(path)
+            indexed = self.files.get(path)
+            if indexed is None or indexed["mtime"] != entry["mtime"] or indexed["size"] != entry["size"]:
+                self.pending[path] = (entry["mtime"], entry["size"])
+        for path in [path for path in self.files if path not in present]:
+            self.remove(path)
+        for path in [path for path in self.pending if path not in present]:
+            del self.pending[path]
+
+    def remove(self, path):
+        if self.files is None:
+            self.removed.add(path)
+            return
+        indexed = self.files.pop(path, None)
+        if indexed is None:
+            return
+        self.dirty = True
+        for paths in self.postings.values():
+            paths.discard(path)
+
+    def add(self, path, text, mtime, size):
+        self.remove(path)
+        trigrams = textTrigrams(text)
+        # Every trigram is three characters, so they are stored run together
+        self.files[path] = {"mtime": mtime, "size": size, "trigrams": "".join(sorted(trigrams))}
+        self.dirty = True
+        for (trigram, paths) in self.postings.items():
+            if trigram in trigrams:
+                paths.add(path)
+
+    def flush(self):
+        """Re-read queued snippets. Call save() afterwards to keep the work for the next session."""
+        if self.files is None:
+            self.load()
+        for (path, (mtime, size)) in self.pending.items():
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace') as snippetFile:
+                    self.add(path, snippetFile.read(), mtime, size)
+            except OSError:
+                self.remove(path)
+        self.pending = {}
+
+    def posting(self, trigram):
+        paths = self.postings.get(trigram)
+        if paths is None:
+            if len(self.postings) > 4096:
+                self.postings.clear()
+            paths = {path for (path, indexed) in self.files.items() if hasTrigram(indexed["trigrams"], trigram)}
+            self.postings[trigram] = paths
+        return paths
+
+    def candidates(self, literals):
+        required = set()
+        for literal in literals:
+            required |= textTrigrams(literal)
+        if not required:
+            return set(self.files)
+        postings = sorted((self.posting(trigram) for trigram in required), key=len)
+        paths = set(postings[0])
+        for posting in postings[1:]:
+            paths &= posting
+        return paths
+
+    def search(self, pattern, regex=False, matchCase=False, maxLines=20, maxFiles=500):
+        """Return [(path, [(lineNumber, line), ...]), ...] for snippets with lines matching pattern.
+
+        Raises re.error for an invalid regular expression."""
+        flags = 0 if matchCase else re.IGNORECASE
+        expression = re.compile(pattern if regex else re.escape(pattern), flags)
+        self.flush()
+        literals = requiredLiterals(pattern, flags) if regex else [pattern]
+        results = []
+        for path in sorted(self.candidates(literals)):
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace') as snippetFile:
+                    lines = snippetFile.read().splitlines()
+            except OSError:
+                continue
+            matches = [(number, line) for (number, line) in enumerate(lines, 1) if expression.search(line)]
+            if matches:
+                results.append((path, matches[:maxLines]))
+                if len(results) >= maxFiles:
+                    break
+        return results
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Lightweight phase tracing for snippet runs, registry reloads and highlighting.
+
+Spans are kept in a bounded in-memory buffer and can be exported as Chrome
+trace-event JSON, which opens in Perfetto (ui.perfetto.dev) or chrome://tracing.
+While tracing is disabled span() hands back a shared no-op object, so leaving
+the instrumentation in hot paths costs next to nothing.
+'''
+
+import os
+import json
+import time
+import threading
+from collections import deque
+
+
+class NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+nullSpan = NullSpan()
+
+
+class Span:
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.tracer.add(self.name, self.category, self.start, end - self.start, self.args)
+        return False
+
+
+class Tracer:
+
+    def __init__(self, maxEvents=200000):
+        self.enabled = False
+        self.events = deque(maxlen=maxEvents)
+        self.threadNames = {}
+        self.lock = threading.Lock()
+
+    def span(self, name, category="snippets", **args):
+        """Context manager recording one complete ("X") event around its body."""
+        if not self.enabled:
+            return nullSpan
+        return Span(self, name, category, args)
+
+    def add(self, name, category, start, duration, args=None):
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": duration * 1e6,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+        }
+        if args:
+            event["args"] = {key: str(value) for key, value in args.items()}
+        with self.lock:
+            self.events.append(event)
+            self.threadNames[thread.ident] = thread.name
+
+    def clear(self):
+        with self.lock:
+            self.events.clear()
+            self.threadNames.clear()
+
+    def chromeTrace(self):
+        """Return the recorded spans as a Chrome trace-event dict."""
+        with self.lock:
+            events = list(self.events)
+            threadNames = dict(self.threadNames)
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                    for tid, name in threadNames.items()]
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+    def export(self, path):
+        with open(path, 'w', encoding='utf-8') as traceFile:
+            json.dump(self.chromeTrace(), traceFile)
+
+
+tracer = Tracer()
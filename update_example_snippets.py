@@ -4,7 +4,12 @@
 
 from zipfile import ZipFile
 from tempfile import TemporaryFile
+from urllib.parse import urljoin
 import os
+import json
+import zlib
+import shutil
+import hashlib
 
 #TODO: Merge remote with local description or hotkey changes (AKA: if filename matches, skip the first two lines, truncate, re-write the rest)
 
@@ -13,45 +18,241 @@ path = b'/psifertex/6fbc7532f536775194edd26290892ef7' # Feel free to adapt to yo
 subfolder = 'default'                                 # Change to save the snippets to a different sub-folder
 tab2space = False
 width = 4
+manifestName = '.update_manifest.json'                # Remembers what the last update fetched and wrote
+chunkSize = 1 << 16                                   # Downloads and extraction are streamed in blocks of this size
 
-def download(url):
+try:
+    log_info
+except NameError:
+    # Running outside of Binary Ninja, see main()
+    log_info = log_error = print
+
+def header(headers, name):
+    for key, value in (headers or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+def fetch(url, headers={}, out=None):
+    # Returns (status, headers, body), a status of 304 means the copy we have is still current
+    # With out, the body is written to that file instead of being returned
+    try:
+        DownloadProvider
+    except NameError:
+        import urllib.request
+        import urllib.error
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+                if out is None:
+                    return response.status, dict(response.headers), response.read()
+                for chunk in iter(lambda: response.read(chunkSize), b''):
+                    out.write(chunk)
+                return response.status, dict(response.headers), None
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return 304, dict(e.headers), b''
+            raise ConnectionError("Unsuccessful download of %s (%d)" % (url, e.code))
     # Can also use 'CoreDownloadProvider' or 'PythonDownloadProvider' as keys here
     provider = DownloadProvider[Settings().get_string('network.downloadProviderName')].create_instance()
-    code, data = provider.get_response(url)
-    if code == 0:
-        return data
+    if hasattr(provider, 'perform_custom_request'):
+        response = provider.perform_custom_request('GET', url, headers)
+        if response is None or response.status_code not in (200, 304):
+            raise ConnectionError("Unsuccessful download of %s" % url)
+        (status, headers, data) = (response.status_code, response.headers, response.content)
     else:
-        raise ConnectionError("Unsuccessful download of %s" % url)
+        code, data = provider.get_response(url)
+        if code != 0:
+            raise ConnectionError("Unsuccessful download of %s" % url)
+        (status, headers) = (200, {})
+    # The download providers hand back the whole body at once
+    if out is not None:
+        out.write(data)
+        data = None
+    return status, headers, data
 
-def update_snippets():
-    if not interaction.show_message_box('Warning', "Use at your own risk. Do you want to automatically overwrite local snippets from gist?", buttons=MessageBoxButtonSet.YesNoButtonSet):
-        return
-    snippetPath = os.path.realpath(os.path.join(user_plugin_path(), '..', 'snippets', subfolder))
+def download(url):
+    return fetch(url)[2]
+
+def extract_member(zip, item, target):
+    # Stream one archive member to target, checking its size and CRC, and return its sha256
+    contentHash = hashlib.sha256()
+    crc = 0
+    size = 0
+    with zip.open(item) as source, open(target, 'wb') as out:
+        for chunk in iter(lambda: source.read(chunkSize), b''):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            if tab2space:
+                chunk = chunk.replace(b'\t', b' ' * width)
+            contentHash.update(chunk)
+            out.write(chunk)
+    if size != item.file_size or crc != item.CRC:
+        raise ValueError("Corrupt archive member %s" % item.filename)
+    return contentHash.hexdigest()
+
+def link_or_copy(source, target):
+    # Hard links keep the mtime (and so the manifest and snippet index entries) of unchanged files
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+def staging_path(snippetPath):
+    # A hidden sibling folder, ignored by the snippet loader
+    return os.path.join(os.path.dirname(snippetPath), '.' + os.path.basename(snippetPath) + '.staging')
+
+def swap_in(staging, snippetPath):
+    # Two renames rather than one atomic exchange: the folder is only missing in between
+    old = staging + '.old'
+    moved = os.path.isdir(snippetPath)
+    if moved:
+        os.rename(snippetPath, old)
+    try:
+        os.rename(staging, snippetPath)
+    except OSError:
+        if moved:
+            os.rename(old, snippetPath)
+        raise
+    shutil.rmtree(old, ignore_errors=True)
+
+def restore_interrupted(snippetPath):
+    # A run stopped between the two renames of swap_in leaves the live folder at .old
+    old = staging_path(snippetPath) + '.old'
+    if os.path.isdir(old) and not os.path.exists(snippetPath):
+        log_info("Restoring %s from an interrupted update" % snippetPath)
+        os.rename(old, snippetPath)
+
+def load_manifest(manifestPath):
+    try:
+        with open(manifestPath, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifestPath, manifest):
+    with open(manifestPath + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifestPath + '.tmp', manifestPath)
+
+def local_hash(filePath, record):
+    # Trust the hash recorded at the last update while the file looks untouched
+    try:
+        stat = os.stat(filePath)
+    except OSError:
+        return None
+    if record and record.get('mtime') == stat.st_mtime_ns and record.get('size') == stat.st_size:
+        return record['hash']
+    with open(filePath, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def unchanged_locally(snippetPath, files):
+    return all(local_hash(os.path.join(snippetPath, name), record) == record['hash'] for name, record in files.items())
+
+def sync_snippets(url, snippetPath):
+    """Bring snippetPath in line with the gist at url, only downloading and writing what changed."""
+    restore_interrupted(snippetPath)
     if not os.path.isdir(snippetPath):
         os.makedirs(snippetPath)
-    url = domain + path
-    log_info("Downloading from: %s" % url)
-    source = download(url)
+    manifestPath = os.path.join(snippetPath, manifestName)
+    manifest = load_manifest(manifestPath)
+    if manifest.get('url') != url:
+        manifest = {'url': url, 'files': {}}
+    files = manifest.setdefault('files', {})
+
+    requestHeaders = {}
+    if manifest.get('etag'):
+        requestHeaders['If-None-Match'] = manifest['etag']
+    if manifest.get('lastModified'):
+        requestHeaders['If-Modified-Since'] = manifest['lastModified']
+    log_info("Checking: %s" % url)
+    (status, headers, source) = fetch(url, requestHeaders)
+    if status == 304 and unchanged_locally(snippetPath, files):
+        log_info("Snippets are up to date.")
+        return 0
+    if status == 304:
+        # Local files were changed or removed, fetch the page again to restore them
+        (status, headers, source) = fetch(url)
+    manifest['etag'] = header(headers, 'ETag')
+    manifest['lastModified'] = header(headers, 'Last-Modified')
+
     zipPath = [s for s in source.split(b'\"') if s.endswith(b'.zip')]
     if len(zipPath) != 1:
         log_error("Update failed.")
-        return
-    url = domain + zipPath[0]
-
-    log_info("Downloading from: %s" % url)
-    zip = download(url)
-    with TemporaryFile() as f:
-        f.write(zip)
-        with ZipFile(f, 'r') as zip:
-            for item in zip.infolist():
-                if item.filename[-1] == '/':
-                    continue
-                basename = os.path.basename(item.filename)
-                with open(os.path.join(snippetPath, basename), 'wb') as f:
-                    if tab2space:
-                        f.write(zip.read(item).replace(b'\t', b' ' * width))
+        return None
+    zipUrl = urljoin(url, zipPath[0].decode('utf-8'))
+    if zipUrl == manifest.get('zip') and unchanged_locally(snippetPath, files):
+        # The archive link names the gist revision, so the same link means the same files
+        save_manifest(manifestPath, manifest)
+        log_info("Snippets are up to date.")
+        return 0
+
+    # Everything is unpacked into a staging folder and swapped in at the end,
+    # so the snippet watcher sees one change. The live folder exists by now,
+    # so anything left at .old is a stale copy
+    staging = staging_path(snippetPath)
+    for leftover in (staging, staging + '.old'):
+        shutil.rmtree(leftover, ignore_errors=True)
+    os.makedirs(staging)
+    written = 0
+    current = {}
+    try:
+        log_info("Downloading from: %s" % zipUrl)
+        with TemporaryFile() as f:
+            fetch(zipUrl, out=f)
+            with ZipFile(f, 'r') as zip:
+                for item in zip.infolist():
+                    if item.filename[-1] == '/':
+                        continue
+                    basename = os.path.basename(item.filename)
+                    stagedPath = os.path.join(staging, basename)
+                    livePath = os.path.join(snippetPath, basename)
+                    contentHash = extract_member(zip, item, stagedPath)
+                    if local_hash(livePath, files.get(basename)) == contentHash:
+                        os.unlink(stagedPath)
+                        link_or_copy(livePath, stagedPath)
                     else:
-                        f.write(zip.read(item))
-                    log_info("Extracting %s" % item.filename)
+                        written += 1
+                        log_info("Extracting %s" % item.filename)
+                    stat = os.stat(stagedPath)
+                    current[basename] = {'hash': contentHash, 'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+        # Snippets dropped from the gist are left alone on disk but no longer tracked
+        manifest['files'] = current
+        manifest['zip'] = zipUrl
+        if written == 0:
+            save_manifest(manifestPath, manifest)
+        else:
+            # Keep local additions, the manifest is rewritten below
+            for entry in os.scandir(snippetPath):
+                if entry.name in current or entry.name == manifestName:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.copytree(entry.path, os.path.join(staging, entry.name), symlinks=True, copy_function=link_or_copy)
+                else:
+                    link_or_copy(entry.path, os.path.join(staging, entry.name))
+            save_manifest(os.path.join(staging, manifestName), manifest)
+            swap_in(staging, snippetPath)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    log_info("Updated %d snippets, %d already current." % (written, len(current) - written))
+    return written
+
+def update_snippets():
+    if not interaction.show_message_box('Warning', "Use at your own risk. Do you want to automatically overwrite local snippets from gist?", buttons=MessageBoxButtonSet.YesNoButtonSet):
+        return
+    snippetPath = os.path.realpath(os.path.join(user_plugin_path(), '..', 'snippets', subfolder))
+    sync_snippets((domain + path).decode('utf-8'), snippetPath)
+
+def main():
+    # Sync without Binary Ninja, e.g. against a local test server:
+    #   python3 update_example_snippets.py http://127.0.0.1:8000/gist.html /tmp/snippets
+    import sys
+    if len(sys.argv) != 3:
+        print("usage: %s <gist url> <snippet folder>" % sys.argv[0])
+        return 1
+    sync_snippets(sys.argv[1], sys.argv[2])
+    return 0
 
-update_snippets()
+if __name__ == '__main__':
+    raise SystemExit(main())
+else:
+    update_snippets()